@@ -0,0 +1,94 @@
+import sys
+import json
+import argparse
+import contextlib
+from backend.batch_job import JobError, load_job, run_job
+from backend.job_scheduler import JobScheduler
+
+"""
+Headless batch runner: python -m backend job.json [job2.json ...] [-o results.json] [--resume] [--slots N [--max-running M]]
+
+Runs every job spec (see batch_job.py) one after another through the same pipeline as the GUI and writes the results
+as a JSON list, to the -o file or to stdout. Progress and the optimizer's own prints go to stderr so stdout stays
+valid JSON. The exit status is 0 when every job finished and 1 otherwise.
+
+With --slots the jobs run concurrently instead, sharing N simulator slots by priority (see job_scheduler.py), and
+every progress line is prefixed with the job's name. --resume continues interrupted least-squares jobs from their
+checkpoints (see checkpoint.py).
+"""
+
+
+def _load(job_path, resume) -> dict:
+    spec = load_job(job_path)
+    if resume:
+        spec["resume"] = True
+    return spec
+
+
+def _run_sequential(job_paths, echo, resume) -> list:
+    results = []
+    for job_path in job_paths:
+        try:
+            spec = _load(job_path, resume)
+            with contextlib.redirect_stdout(sys.stderr):
+                result = run_job(spec, echo)
+        except JobError as e:
+            result = {"status": "failed", "error": str(e)}
+        result["job"] = job_path
+        results.append(result)
+        print(f"{job_path}: {result['status']}" + (f" ({result['error']})" if result["error"] else ""), file=sys.stderr)
+    return results
+
+
+def _run_concurrent(job_paths, echo, resume, slots, max_running) -> list:
+    scheduler = JobScheduler(slots, max_running)
+    results = [None] * len(job_paths)
+    job_ids = {}
+    for i, job_path in enumerate(job_paths):
+        try:
+            job_ids[scheduler.submit(_load(job_path, resume))] = i
+        except JobError as e:
+            results[i] = {"status": "failed", "error": str(e)}
+
+    def on_message(name, message):
+        if echo is not None and message[0] in ("Update", "Failed"):
+            echo(f"[{name}] {message[1]}")
+
+    with contextlib.redirect_stdout(sys.stderr):
+        for job_id, result in enumerate(scheduler.run(on_message)):
+            results[job_ids[job_id]] = result
+    for job_path, result in zip(job_paths, results):
+        result["job"] = job_path
+        print(f"{job_path}: {result['status']}" + (f" ({result['error']})" if result["error"] else ""), file=sys.stderr)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend", description="Run XycLOps optimization jobs without the GUI.")
+    parser.add_argument("jobs", nargs="+", help="job spec JSON files")
+    parser.add_argument("-o", "--output", help="write the results JSON here instead of stdout")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress messages")
+    parser.add_argument("--resume", action="store_true", help="continue least-squares jobs from their checkpoints")
+    parser.add_argument("--slots", type=int, help="run the jobs concurrently with at most this many simulations at once")
+    parser.add_argument("--max-running", type=int, help="with --slots, run at most this many jobs at once")
+    args = parser.parse_args(argv)
+    if args.slots is not None and args.slots < 1 or args.max_running is not None and args.max_running < 1:
+        parser.error("--slots and --max-running must be at least 1")
+
+    echo = None if args.quiet else (lambda message: print(message, file=sys.stderr, flush=True))
+    if args.slots is None:
+        results = _run_sequential(args.jobs, echo, args.resume)
+    else:
+        results = _run_concurrent(args.jobs, echo, args.resume, args.slots, args.max_running)
+
+    text = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    return 0 if all(result["status"] == "done" for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
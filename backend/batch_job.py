@@ -0,0 +1,236 @@
+import os
+import re
+import csv
+import json
+from backend.netlist_parse import Netlist
+from backend.optimzation_process import optimizeProcess
+from backend.checkpoint import checkpoint_path_for
+
+"""
+Headless optimization jobs, run with "python -m backend job.json" (see __main__.py) on machines without a display.
+
+A job spec is a JSON object holding everything the Tk screens would otherwise collect. Relative paths are relative to
+the job file:
+
+{
+    "netlist": "netlists/voltageDivider.txt",
+    "selected_parameters": ["R1", "R2"],
+    "target_value": "V(2)",
+    "target_csv": "target.csv",              x,y rows, as the curve fit settings screen reads them
+    "constraints": "constraints.json",       a file in the constraints.json format, or the list itself
+    "tolerances": [1e-12, 1e-12, 1e-12],     xtol, gtol, ftol (optional, these are the defaults)
+    "rlc_bounds": [false, false, false],     default bounds for R, L and C (optional, these are the defaults)
+    "output_netlist": "fitted.txt",          where the fitted netlist goes (optional, <netlist>Copy.txt by default)
+    "name": "divider",                       label and priority when run concurrently (optional, see job_scheduler.py)
+    "priority": 2
+}
+
+Any optimizeProcess keyword argument can be added under its snake_case name (see OPTIONAL_ARGUMENTS), e.g.
+"simulator": "standin" or "engine": "multi-start". Constraints without a "type" are typed the way the
+optimization settings screen does it: a selected parameter on the left makes a parameter constraint, a node
+expression such as V(2) a node constraint.
+
+Least-squares jobs write a checkpoint (see checkpoint.py) while they run, <output netlist>.checkpoint unless
+"checkpoint" names another file. With "resume": true (or python -m backend --resume) a job continues from it.
+
+This module must not import tkinter or matplotlib, directly or through the frontend.
+"""
+
+# Job spec key -> optimizeProcess keyword argument
+OPTIONAL_ARGUMENTS = {
+    "jacobian_workers": "jacobianWorkers",
+    "simulator": "simulator",
+    "jacobian_mode": "jacobianMode",
+    "engine": "engine",
+    "max_simulations": "maxSimulations",
+    "starts": "starts",
+    "target_cost": "targetCost",
+    "generations": "generations",
+    "parameter_transform": "parameterTransform",
+    "tran_preset": "tranPreset",
+    "checkpoint": "checkpointPath",
+    "resume": "resume",
+}
+
+REQUIRED_KEYS = ("netlist", "selected_parameters", "target_value", "target_csv")
+
+OTHER_KEYS = ("constraints", "tolerances", "rlc_bounds", "output_netlist", "name", "priority")
+
+_NODE_EXPRESSION = re.compile(r"^[VI]\(.+\)$", re.IGNORECASE)
+
+
+class JobError(Exception):
+    """Raised for a job spec that cannot be run."""
+
+    pass
+
+
+def _resolve(path: str, base_dir: str) -> str:
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path))
+
+
+def read_target_csv(file_path: str) -> list:
+    """Reads x,y rows like the curve fit settings screen does, skipping rows that are not two numbers."""
+    data_points = []
+    with open(file_path, "r", newline="") as file:
+        for row in csv.reader(file):
+            try:
+                x, y = map(float, row)
+            except ValueError:
+                print(f"Skipping row: {row} - Invalid data format")
+                continue
+            data_points.append([x, y])
+    if len(data_points) < 2:
+        raise JobError(f"Target curve {file_path} has fewer than two x,y rows")
+    return data_points
+
+
+def typed_constraints(constraints: list, selected_parameters: list) -> list:
+    """Copies constraints in the constraints.json format and gives every one its "parameter" or "node" type."""
+    typed = []
+    for constraint in constraints:
+        if not isinstance(constraint, dict) or not all(key in constraint for key in ("left", "operator", "right")):
+            raise JobError(f"Invalid constraint {constraint!r}: must contain 'left', 'operator', and 'right' keys")
+        constraint = dict(constraint)
+        if "type" not in constraint:
+            left = constraint["left"].strip()
+            if left in selected_parameters:
+                constraint["type"] = "parameter"
+            elif _NODE_EXPRESSION.match(left):
+                constraint["type"] = "node"
+            else:
+                raise JobError(f"Invalid left-hand side '{left}': must be a selected parameter or a node expression (e.g. V(2))")
+        typed.append(constraint)
+    return typed
+
+
+def load_job(job_path: str) -> dict:
+    """Reads and checks a job spec file, returning it with paths resolved and constraints typed.
+
+    Raises:
+        JobError: If the spec is malformed or refers to files that do not exist.
+    """
+    try:
+        with open(job_path, "r") as file:
+            spec = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        raise JobError(f"Cannot read job spec {job_path}: {e}")
+    if not isinstance(spec, dict):
+        raise JobError("A job spec must be a JSON object")
+    missing = [key for key in REQUIRED_KEYS if key not in spec]
+    if missing:
+        raise JobError(f"Job spec is missing {', '.join(missing)}")
+    unknown = [key for key in spec if key not in REQUIRED_KEYS + OTHER_KEYS and key not in OPTIONAL_ARGUMENTS]
+    if unknown:
+        raise JobError(f"Unknown job spec keys: {', '.join(unknown)}")
+
+    base_dir = os.path.dirname(os.path.abspath(job_path))
+    spec = dict(spec)
+    spec["netlist"] = _resolve(spec["netlist"], base_dir)
+    spec["target_csv"] = _resolve(spec["target_csv"], base_dir)
+    for key in ("output_netlist", "checkpoint"):
+        if key in spec:
+            spec[key] = _resolve(spec[key], base_dir)
+    for key in ("netlist", "target_csv"):
+        if not os.path.isfile(spec[key]):
+            raise JobError(f"{key} file not found: {spec[key]}")
+
+    constraints = spec.get("constraints", [])
+    if isinstance(constraints, str):
+        constraints_path = _resolve(constraints, base_dir)
+        try:
+            with open(constraints_path, "r") as file:
+                constraints = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            raise JobError(f"Cannot read constraints {constraints_path}: {e}")
+    if not isinstance(constraints, list):
+        raise JobError("Invalid constraints format: must be a list")
+    spec["constraints"] = typed_constraints(constraints, spec["selected_parameters"])
+
+    spec["tolerances"] = [float(x) for x in spec.get("tolerances", [1e-12, 1e-12, 1e-12])]
+    spec["rlc_bounds"] = [bool(x) for x in spec.get("rlc_bounds", [False, False, False])]
+    if len(spec["tolerances"]) != 3 or len(spec["rlc_bounds"]) != 3:
+        raise JobError("tolerances and rlc_bounds must have three entries each")
+    return spec
+
+
+class MessageCollector:
+    """Stands in for the GUI's queue: keeps what optimizeProcess reports and echoes the progress messages.
+
+    With a channel every message (except the live plot's waveforms) is also passed on to it as it arrives.
+    """
+
+    def __init__(self, echo=None, channel=None):
+        self.echo = echo
+        self.channel = channel
+        self.updates = []
+        self.netlist = None
+        self.results = None
+        self.status = None
+        self.error = None
+
+    def put(self, message):
+        msg_type, msg_value = message
+        if self.channel is not None and msg_type != "UpdateYData":
+            self.channel.put(message)
+        if msg_type == "Update":
+            self.updates.append(msg_value)
+            if self.echo is not None:
+                self.echo(msg_value)
+        elif msg_type == "UpdateNetlist":
+            self.netlist = msg_value
+        elif msg_type == "UpdateOptimizationResults":
+            self.results = msg_value
+        elif msg_type == "Done":
+            self.status = "done"
+        elif msg_type == "Failed":
+            self.status = "failed"
+            self.error = msg_value
+            if self.echo is not None:
+                self.echo(f"Optimization Failed: {msg_value}")
+
+
+def run_job(spec: dict, echo=None, channel=None, slots=None) -> dict:
+    """Runs a loaded job spec through optimizeProcess and returns the result as a JSON-ready dict.
+
+    Args:
+        spec: Job spec as returned by load_job.
+        echo: Called with every progress message as it arrives, e.g. print. None keeps quiet.
+        channel: Queue (anything with put) that gets every message as it arrives.
+        slots: Shared simulator slots every simulation waits for (see job_scheduler.py). None runs them right away.
+    """
+    netlist = Netlist(spec["netlist"])
+    curve_data = {"y_parameter": spec["target_value"], "constraints": spec["constraints"]}
+    target_rows = read_target_csv(spec["target_csv"])
+    keyword_arguments = {OPTIONAL_ARGUMENTS[key]: value for key, value in spec.items() if key in OPTIONAL_ARGUMENTS}
+
+    output_netlist = spec.get("output_netlist") or spec["netlist"][:-4] + "Copy.txt"
+    # Jobs always checkpoint, so an interrupted one can be continued with "resume"
+    keyword_arguments.setdefault("checkpointPath", checkpoint_path_for(output_netlist))
+
+    collector = MessageCollector(echo, channel)
+    optimizeProcess(collector, curve_data, target_rows, spec["netlist"], netlist, spec["selected_parameters"],
+                    spec["tolerances"], spec["rlc_bounds"], outputNetlistPath=output_netlist, simulatorSlots=slots,
+                    **keyword_arguments)
+
+    result = {
+        "netlist": spec["netlist"],
+        "status": collector.status or "failed",
+        "error": collector.error,
+        "output_netlist": None,
+        "results": None,
+        "component_values": None,
+        "updates": collector.updates,
+    }
+    if collector.status == "done":
+        xyce_runs, iterations, initial_cost, final_cost, optimality = collector.results
+        result["output_netlist"] = output_netlist
+        result["results"] = {
+            "xyce_runs": xyce_runs,
+            "iterations": iterations,
+            "initial_cost": initial_cost,
+            "final_cost": final_cost,
+            "optimality": optimality,
+        }
+        result["component_values"] = {name: float(value) for name, value in collector.netlist.components.values_dict().items()}
+    return result
@@ -0,0 +1,122 @@
+import os
+import time
+import pickle
+import hashlib
+import numpy as np
+from backend.xyce_parsing_function import CurveFitError
+
+"""
+Checkpoints of a running curvefit_optimize, so an interrupted fit can continue where it stopped.
+
+A checkpoint is a pickle holding the best point evaluated so far (in component values and in the search coordinates
+of its parameter transform), its cost, the simulation and function evaluation counters, the initial cost, the last
+Jacobian together with the point it was computed at, and the simulation cache. It is written at most every
+CHECKPOINT_INTERVAL seconds while the fit runs and once more when the fit fails or is stopped, always to a temporary
+file first and then renamed over the old one, so a crash while writing never leaves a half written checkpoint behind.
+A fit that finishes removes its checkpoint.
+
+least_squares does not expose its trust region, so a resumed fit starts a new one at the best point. Its first
+Jacobian is the saved one when it was computed at that point, and the saved cache serves every simulation the
+interrupted fit already ran, so resuming costs no simulations that were done before.
+
+Every checkpoint carries a key over the netlist, the target curve, the tuned components and the constraints. Resuming
+from a checkpoint of a different fit raises CheckpointError instead of silently starting from unrelated values.
+"""
+
+CHECKPOINT_VERSION = 1
+
+# Seconds between periodic checkpoints
+CHECKPOINT_INTERVAL = 30.0
+
+
+class CheckpointError(CurveFitError):
+    """Raised when a checkpoint cannot be read or belongs to a different optimization."""
+
+    pass
+
+
+def checkpoint_path_for(output_netlist_path: str) -> str:
+    """Default checkpoint file of a run, next to the netlist it writes its result to."""
+    return os.path.splitext(output_netlist_path)[0] + ".checkpoint"
+
+
+def run_key(netlist_fingerprint: str, target_value: str, target_curve_rows, component_names: list, node_constraints: dict,
+            equality_part_constraints: list) -> str:
+    """Identifies an optimization, checkpoints only resume runs with the same key."""
+    digest = hashlib.sha1()
+    digest.update(netlist_fingerprint.encode())
+    digest.update(target_value.upper().encode())
+    digest.update(np.ascontiguousarray(target_curve_rows, dtype=np.float64).tobytes())
+    digest.update(repr((list(component_names), sorted(node_constraints.items()), list(equality_part_constraints))).encode())
+    return digest.hexdigest()
+
+
+class OptimizationCheckpoint:
+    """Reads and writes the checkpoint file of one optimization."""
+
+    def __init__(self, path: str, key: str, interval: float = CHECKPOINT_INTERVAL):
+        """
+        Args:
+            path: Checkpoint file, see checkpoint_path_for.
+            key: run_key of the optimization.
+            interval: Smallest number of seconds between two periodic saves.
+        """
+        self.path = path
+        self.key = key
+        self.interval = interval
+        self.last_save = time.monotonic()
+        self.saves = 0
+
+    def load(self):
+        """Returns the saved state, or None when there is no checkpoint file.
+
+        Raises:
+            CheckpointError: If the file cannot be read or was written by a different optimization.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                state = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            raise CheckpointError(f"Cannot read checkpoint {self.path}: {e}")
+        if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+            raise CheckpointError(f"Checkpoint {self.path} was written by an incompatible version")
+        if state.get("key") != self.key:
+            raise CheckpointError(f"Checkpoint {self.path} belongs to a different optimization (netlist, target, "
+                                  "tuned components or constraints changed)")
+        return state
+
+    def due(self) -> bool:
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, state: dict) -> None:
+        state = dict(state, version=CHECKPOINT_VERSION, key=self.key, saved_at=time.time())
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.path)
+        self.last_save = time.monotonic()
+        self.saves += 1
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ResumedJacobian:
+    """Jacobian callable that answers its first call at the saved point with the saved matrix, then defers to jacobian."""
+
+    def __init__(self, jacobian, point, matrix):
+        self.jacobian = jacobian
+        self.point = None if point is None else np.asarray(point, dtype=float)
+        self.matrix = matrix
+
+    def __call__(self, x, *args):
+        if self.point is not None:
+            point, self.point = self.point, None
+            if np.array_equal(point, np.asarray(x, dtype=float)):
+                return np.array(self.matrix)
+        return self.jacobian(x, *args)
@@ -0,0 +1,105 @@
+import ast
+import numpy as np
+from frontend.optimization_settings.expression_evaluator import ExpressionEvaluator
+from backend.netlist_parse import ComponentTable
+
+"""
+Compile-once evaluation of part constraint expressions.
+
+The right-hand side of a part constraint (e.g. "R1 + 2*R2") is validated with the same ExpressionEvaluator the
+constraint dialogs use, so only component names and the whitelisted math functions can appear in it, and is then
+compiled to a code object once. Evaluating it afterwards only looks the referenced components up in the
+ComponentTable's value array. Equality constraints are applied in dependency order, so "R3 = R2" followed by
+"R2 = 2*R1" gives R3 the freshly computed R2.
+"""
+
+
+def compile_expression(expression: str, table: ComponentTable):
+    """Validates expression and returns a function mapping the table's value array to the expression's value.
+
+    Raises:
+        ValueError: If the expression is not valid or uses something other than component names and allowed functions.
+    """
+    evaluator = ExpressionEvaluator(parameters=table.names)
+    is_valid, names_used = evaluator.validate_expression(expression)
+    if not is_valid:
+        raise ValueError(f"Invalid constraint expression: {expression}")
+    code = compile(ast.parse(expression.strip(), mode="eval"), f"<constraint {expression.strip()}>", "eval")
+    environment = {"__builtins__": {}, **ExpressionEvaluator._allowed_funcs}
+    positions = [(name, table.index[name]) for name in names_used]
+
+    def evaluate(values):
+        return float(eval(code, environment, {name: values[position] for name, position in positions}))
+    evaluate.names_used = names_used
+    return evaluate
+
+
+class EqualityConstraintEngine:
+    """Applies equality part constraints ("left = expression") to a ComponentTable."""
+
+    def __init__(self, table: ComponentTable, equality_part_constraints: list):
+        self.equality_part_constraints = list(equality_part_constraints)
+        self._compile(table)
+
+    def _compile(self, table: ComponentTable) -> None:
+        compiled = {}
+        for constraint in self.equality_part_constraints:
+            left = constraint["left"].strip()
+            if left not in table:
+                continue
+            compiled[left] = compile_expression(constraint["right"], table)
+
+        # Topological order: a constrained component is computed after every constrained component its expression uses
+        self.order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Circular equality constraints: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dependency in compiled[name].names_used:
+                if dependency in compiled and dependency != name:
+                    visit(dependency, path + [name])
+            state[name] = "done"
+            self.order.append((name, table.index[name], compiled[name]))
+
+        for name in compiled:
+            visit(name, [])
+
+    def __getstate__(self):
+        # Code objects don't pickle, worker processes recompile from the constraint strings
+        return {"equality_part_constraints": self.equality_part_constraints}
+
+    def __setstate__(self, state):
+        self.equality_part_constraints = state["equality_part_constraints"]
+        self.order = None
+
+    def apply(self, table: ComponentTable) -> dict:
+        """Sets every constrained component from its expression and returns the values written as name -> value."""
+        if self.order is None:
+            self._compile(table)
+        params = {}
+        for name, position, evaluate in self.order:
+            value = evaluate(table.values)
+            table.values[position] = value
+            table.modified_mask[position] = True
+            table.variable_mask[position] = False
+            params[name] = value
+        return params
+
+    def evaluate(self, table: ComponentTable, values) -> np.ndarray:
+        """Returns a copy of values (a full value array of table) with the constraints applied, leaving table alone."""
+        if self.order is None:
+            self._compile(table)
+        values = np.array(values, dtype=float)
+        for name, position, evaluate in self.order:
+            values[position] = evaluate(values)
+        return values
+
+    def constrained_names(self) -> list:
+        return [name for name, _, _ in self.order or []]
+
+    def __len__(self):
+        return len(self.equality_part_constraints)
@@ -1,11 +1,20 @@
 import numpy as np
-import subprocess
 import io
 import sys
 from scipy.optimize import least_squares
-from scipy.interpolate import interp1d
-from backend.xyce_parsing_function import parse_xyce_prn_output
 from backend.netlist_parse import Netlist
+from backend.residual_evaluation import simulate_component_values, compute_residuals, LiveWaveform
+from backend.simulator_backend import SimulatorBackend, XyceBackend, AbortStats
+from backend.evaluation_pool import EvaluationPool
+from backend.parallel_jacobian import ParallelJacobian
+from backend.sensitivity_jacobian import SensitivityJacobian
+from backend.broyden_jacobian import BroydenJacobian
+from backend.simulation_cache import SimulationCache, netlist_fingerprint
+from backend.target_grid import TargetGrid
+from backend.constraint_engine import EqualityConstraintEngine
+from backend.xyce_parsing_function import OptimizationStopped
+from backend.parameter_transform import make_transform
+from backend.checkpoint import OptimizationCheckpoint, ResumedJacobian, run_key
 
 """
 Two constraint types:
@@ -22,119 +31,270 @@ node_constraints = {
     'V(3)': (1.0, None)   # Example: V(3) must be >= 1V
 }
 """
-def curvefit_optimize(target_value: str, target_curve_rows: list, netlist: Netlist, writable_netlist_path: str, node_constraints: dict, equality_part_constraints: list,queue, custom_xtol= 1e-12,custom_gtol= 1e-12,custom_ftol= 1e-12) -> None:
+def curvefit_optimize(target_value: str, target_curve_rows: list, netlist: Netlist, writable_netlist_path: str, node_constraints: dict, equality_part_constraints: list,queue, custom_xtol= 1e-12,custom_gtol= 1e-12,custom_ftol= 1e-12, jacobian_workers= 1, cache_size= 128, backend: SimulatorBackend = None, jacobian_mode= "finite-difference", stop_event= None, parameter_transform= "linear", checkpoint_path= None, resume= False, live_plot= False) -> None:
     old_stdout = sys.stdout
     sys.stdout = io.StringIO()  # Redirect output
 
+    pool = None
+    checkpoint = None
+    finished = False
     try:
         global xyceRuns
         xyceRuns = 0
         # Assumes input_curve[0] is X, input_curve[1] is Y/target_value
-        x_ideal = np.array([x[0] for x in target_curve_rows])
-        y_ideal = np.array([x[1] for x in target_curve_rows])
-        ideal_interpolation = interp1d(x_ideal, y_ideal)
+        # Residuals are always evaluated on the target's own x points, fixed before the first Xyce run
+        target_grid = TargetGrid(target_curve_rows)
 
         local_netlist_file = writable_netlist_path 
+        if backend is None:
+            backend = XyceBackend(local_netlist_file)
+        # Only the time axis, the fitted value and the constrained nodes are ever looked at
+        backend.output_columns = ["TIME", target_value] + list(node_constraints)
+        # Runs that break a node constraint are stopped as soon as it shows in the output, they only get the penalty anyway
+        backend.enable_early_abort(node_constraints)
+        # Long runs show up on the live plot while they are simulated (only in this process, workers don't stream). Only
+        # the GUI has a live plot, without one runs are not streamed at all
+        backend.stream_output(LiveWaveform(queue, target_value) if live_plot else None)
     
         # Parse netlist to figure out which parts are subject to change
-        changing_components = [x for x in netlist.components if x.variable]
-        changing_components_values = [x.value for x in changing_components]
+        table = netlist.components
+        changing_indices = np.flatnonzero(table.variable_mask)
+        changing_components_values = table.values[changing_indices].copy()
+        changing_components_names = [table[i].name for i in changing_indices]
 
-        lower_bounds = np.array([x.minVal if hasattr(x, "minVal") else 0 for x in changing_components])
-        upper_bounds = np.array([x.maxVal if hasattr(x, "maxVal") else np.inf for x in changing_components])
+        lower_bounds = table.min_vals[changing_indices].copy()
+        upper_bounds = table.max_vals[changing_indices].copy()
 
-        run_state = {
-            "first_run": True,
-            "master_x_points": np.array([])
-        }
+        # least_squares works in the transform's search coordinates (e.g. log of the values), which are converted
+        # back to component values before every simulation
+        transform = make_transform(parameter_transform, changing_components_values, lower_bounds, upper_bounds)
+        search_start = transform.to_search(changing_components_values)
+        search_lower, search_upper = transform.search_bounds()
 
-        def residuals(component_values, components):
+        # Equality constraint expressions are validated and compiled once, not eval()'d on every simulation
+        constraint_engine = EqualityConstraintEngine(table, equality_part_constraints)
+
+        # Repeated parameter vectors are served from the cache instead of rerunning Xyce
+        fingerprint = netlist_fingerprint(local_netlist_file)
+        cache = SimulationCache(fingerprint, cache_size) if cache_size else None
+
+        # Best point so far and the last Jacobian, written to the checkpoint file every so often (see checkpoint.py)
+        progress = {"best_values": None, "best_search": None, "best_cost": np.inf, "initial_cost": None,
+                    "function_evaluations": 0, "jacobian_point": None, "jacobian": None}
+
+        def save_checkpoint():
+            if checkpoint is not None and progress["best_values"] is not None:
+                checkpoint.save(dict(progress, xyce_runs=xyceRuns, transform=parameter_transform,
+                                     cache=cache.entries if cache is not None else None))
+
+        resumed = None
+        if checkpoint_path is not None:
+            checkpoint = OptimizationCheckpoint(checkpoint_path, run_key(fingerprint, target_value, target_curve_rows, changing_components_names,
+                                                                         node_constraints, equality_part_constraints))
+            if resume:
+                resumed = checkpoint.load()
+                if resumed is None:
+                    queue.put(("Update",f"No checkpoint at {checkpoint_path}, starting from the netlist's values"))
+        if resumed is not None:
+            progress.update((key, resumed[key]) for key in progress)
+            xyceRuns = resumed["xyce_runs"]
+            if cache is not None and resumed["cache"] is not None:
+                cache.restore(resumed["cache"])
+            if resumed["transform"] == parameter_transform:
+                search_start = np.array(resumed["best_search"])
+            else:
+                search_start = transform.to_search(resumed["best_values"])
+                progress["jacobian_point"] = None
+            queue.put(("Update",f"Resuming from checkpoint: {xyceRuns} simulations done, best cost {progress['best_cost']:.5g}"))
+
+        # Each 3-point Jacobian needs 2n independent Xyce runs, spread them over a process pool when asked to
+        jacobian = '3-point'
+        jacobian_workers = min(jacobian_workers or 1, 2 * len(changing_indices))
+        if jacobian_workers > 1:
+            pool = EvaluationPool(jacobian_workers, backend, netlist, local_netlist_file, changing_components_names, target_value,
+                                  target_grid, node_constraints, constraint_engine)
+
+            def evaluate_points(points):
+                global xyceRuns
+                # Checked before every batch, as evaluate() does before every simulation
+                if stop_event is not None and stop_event.is_set():
+                    raise OptimizationStopped("Optimization stopped")
+                component_values = [transform.to_values(point) for point in points]
+                # Only the points the cache does not hold are simulated, and their results are cached like evaluate()'s
+                results = [cache.get(values) if cache is not None else None for values in component_values]
+                missing = [i for i, columns in enumerate(results) if columns is None]
+                if missing:
+                    xyceRuns += len(missing)
+                    queue.put(("Update",f"total runs completed: {xyceRuns}"))
+                    for i, columns in zip(missing, pool.simulate([component_values[i] for i in missing])):
+                        results[i] = columns
+                        # Workers never compute sensitivities, keep their results out of the cache while runs need them
+                        if cache is not None and backend.sensitivity is None:
+                            cache.put(component_values[i], columns)
+                return [compute_residuals(columns, target_value, target_grid, node_constraints)[0] for columns in results]
+
+            jacobian = ParallelJacobian(evaluate_points, search_lower, search_upper)
+
+        def evaluate(search_values):
             global xyceRuns
-            xyceRuns += 1
-            new_netlist = netlist
-            new_netlist.file_path = local_netlist_file
-
-            # Edit new_netlist with correct values
-            for i in range(len(component_values)):
-                for netlist_component in new_netlist.components:
-                    if components[i].name == netlist_component.name:
-                        netlist_component.value = component_values[i]
-                        netlist_component.modified = True
-                        break
-
-            # ENFORCE EQUALITY PART CONSTRAINTS
-            componentVals = {}
-            for component in new_netlist.components:
-                componentVals[component.name] = component.value
-            for constraint in equality_part_constraints:
-                left = constraint["left"].strip()
-                right = constraint["right"].strip()
-                for component in new_netlist.components:
-                    if left == component.name:
-                        component.value = eval(right, componentVals)
-                        component.variable = False
-                        component.modified = True
-            
-            new_netlist.class_to_file(local_netlist_file)
-            subprocess.run(["Xyce", "-delim", "COMMA", "-quiet", local_netlist_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            #TODO: Smart way to set timestep and ensure consistency. Rn just decided arbitrarily by first run
-            xyce_parse = parse_xyce_prn_output(local_netlist_file + ".prn")
-
-            # Assumes Xyce output is Index, Time, arb. # of VALUES
-            row_index = xyce_parse[0].index(target_value.upper())
-
-            X_ARRAY_FROM_XYCE = np.array([float(x[1]) for x in xyce_parse[1]])
-            Y_ARRAY_FROM_XYCE = np.array([float(x[row_index]) for x in xyce_parse[1]])
-
-            if run_state["first_run"]:
-                run_state["first_run"] = False
-                run_state["master_x_points"] = X_ARRAY_FROM_XYCE
-
-
-            if (xyceRuns % 5 == 0):
-                queue.put(("Update",f"total runs completed: {xyceRuns}"))
+            component_values = transform.to_values(search_values)
+            columns = cache.get(component_values) if cache is not None else None
+            if columns is None:
+                # Checked before every simulation, e.g. so other multi-start runs can end this one early
+                if stop_event is not None and stop_event.is_set():
+                    raise OptimizationStopped("Optimization stopped")
+                xyceRuns += 1
+                columns = simulate_component_values(backend, netlist, changing_components_names, component_values, constraint_engine)
+                if cache is not None:
+                    cache.put(component_values, columns)
+
+                if (xyceRuns % 5 == 0):
+                    queue.put(("Update",f"total runs completed: {xyceRuns}"))
+                    if cache is not None:
+                        queue.put(("Update",cache.stats_message()))
+
+            residual, X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE = compute_residuals(columns, target_value, target_grid, node_constraints)
+            return residual, columns, X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE
+
+        if (jacobian_mode in ("sensitivity", "broyden") or checkpoint is not None) and jacobian == '3-point':
+            # These modes call the finite-difference Jacobian themselves and checkpoints keep the last one, so it has
+            # to be a callable
+            jacobian = ParallelJacobian(lambda points: [evaluate(point)[0] for point in points], search_lower, search_upper)
+
+        # "broyden": one finite-difference Jacobian, then rank-one updates until progress stalls
+        if jacobian_mode == "broyden":
+            runs_before_iteration = [0]
+
+            def report_iteration(iteration, kind):
+                queue.put(("Update",f"iteration {iteration}: {xyceRuns - runs_before_iteration[0]} simulations ({kind})"))
+                runs_before_iteration[0] = xyceRuns
+
+            jacobian = BroydenJacobian(jacobian, on_iteration=report_iteration)
+
+        # "sensitivity": one run gives the residual and, through .SENS, the whole Jacobian. Finite differences stay the fallback
+        if jacobian_mode == "sensitivity":
+            # Workers keep their own copy of the backend, only the main process asks for sensitivities
+            backend = backend.with_netlist_path(local_netlist_file)
+
+            def sensitivities_unavailable():
+                backend.enable_sensitivities(target_value, None)
+                queue.put(("Update","No sensitivities from the simulator, using finite differences"))
+
+            jacobian = SensitivityJacobian(lambda x: evaluate(x)[:2], table, changing_components_names, target_grid,
+                                           constraint_engine, jacobian, on_unavailable=sensitivities_unavailable, transform=transform)
+            backend.enable_sensitivities(target_value, jacobian.sensitivity_names())
+
+        def residuals(search_values):
+            residual, columns, X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE = evaluate(search_values)
+
             queue.put(("UpdateYData",(X_ARRAY_FROM_XYCE,Y_ARRAY_FROM_XYCE))) 
 
-            xyce_interpolation = interp1d(X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE)
+            cost = 0.5 * np.dot(residual, residual)
+            queue.put(("UpdateCost",[float(cost)]))
+            progress["function_evaluations"] += 1
+            if progress["initial_cost"] is None:
+                progress["initial_cost"] = cost
+            if cost < progress["best_cost"]:
+                progress["best_cost"] = cost
+                progress["best_search"] = np.array(search_values, dtype=float)
+                progress["best_values"] = transform.to_values(progress["best_search"])
+            if checkpoint is not None and checkpoint.due():
+                save_checkpoint()
+
+            if isinstance(jacobian, SensitivityJacobian):
+                jacobian.remember(search_values, residual, columns)
+            elif isinstance(jacobian, (ParallelJacobian, BroydenJacobian)):
+                jacobian.remember(search_values, residual)
+            return residual
 
-            for node_name, (node_lower, node_upper) in node_constraints.items():
-                node_index = xyce_parse[0].index(node_name.upper())
-                node_values = np.array([float(x[node_index]) for x in xyce_parse[1]])
-                if (node_lower is not None and np.any(node_values < node_lower)) or (node_upper is not None and np.any(node_values > node_upper)):
-                    return np.full_like(run_state["master_x_points"], 1e6)  # TODO: Right now its just an arbitraritly large penalty
+        def recording_jacobian(search_values, *args):
+            # Keeps the last Jacobian for the checkpoint
+            matrix = jacobian(search_values, *args)
+            progress["jacobian_point"] = np.array(search_values, dtype=float)
+            progress["jacobian"] = np.array(matrix, dtype=float)
+            if checkpoint.due():
+                save_checkpoint()
+            return matrix
 
-            # TODO: Proper residual? (subrtarct, rms, etc.)
-            return ideal_interpolation(run_state["master_x_points"]) - xyce_interpolation(run_state["master_x_points"])
+        least_squares_jacobian = recording_jacobian if checkpoint is not None else jacobian
 
-        result = least_squares(residuals, changing_components_values, method='trf', bounds=(lower_bounds, upper_bounds), args=(changing_components,),
-                               xtol=custom_xtol, gtol=custom_gtol, ftol = custom_ftol, jac='3-point', verbose=1)
+        # A resumed run takes its first Jacobian from the checkpoint when it was computed at the starting point
+        first_jacobian = least_squares_jacobian
+        if resumed is not None and progress["jacobian_point"] is not None:
+            first_jacobian = ResumedJacobian(least_squares_jacobian, progress["jacobian_point"], progress["jacobian"])
 
-        for i in range(len(changing_components)):
-            changing_components[i].value = result.x[i]
+        result = least_squares(residuals, search_start, method='trf', bounds=(search_lower, search_upper),
+                               xtol=custom_xtol, gtol=custom_gtol, ftol = custom_ftol, jac=first_jacobian, verbose=1)
+        # A Broyden run can stop on xtol/ftol only because rejected secant steps shrank the trust region, start over
+        # from its result with a fresh trust region and finite-difference Jacobian while that still lowers the cost. When a
+        # restart does not, the fit is finished with finite-difference Jacobians only instead of returning a stalled point
+        restarts = 0
+        while isinstance(jacobian, BroydenJacobian) and result.status in (2, 3, 4) and jacobian.total_updates > 0 and restarts < 10:
+            restarts += 1
+            jacobian.restart()
+            queue.put(("Update",f"restarting least squares from cost {result.cost:.5g}"))
+            restarted = least_squares(residuals, result.x, method='trf', bounds=(search_lower, search_upper),
+                                      xtol=custom_xtol, gtol=custom_gtol, ftol = custom_ftol, jac=least_squares_jacobian, verbose=1)
+            improved = restarted.cost < result.cost
+            if restarted.cost <= result.cost:
+                result = restarted
+            if not improved:
+                break
+        if isinstance(jacobian, BroydenJacobian) and result.status in (2, 3, 4) and jacobian.total_updates > 0:
+            jacobian.stop_updates()
+            jacobian.restart()
+            queue.put(("Update",f"Broyden updates stalled at cost {result.cost:.5g}, finishing with finite-difference Jacobians"))
+            refined = least_squares(residuals, result.x, method='trf', bounds=(search_lower, search_upper),
+                                    xtol=custom_xtol, gtol=custom_gtol, ftol = custom_ftol, jac=least_squares_jacobian, verbose=1)
+            if refined.cost <= result.cost:
+                result = refined
+        if cache is not None:
+            queue.put(("Update",cache.stats_message()))
+        if backend.node_watch is not None:
+            abort_stats = AbortStats()
+            abort_stats.add(backend.abort_stats)
+            if pool is not None:
+                abort_stats.add(pool.abort_stats)
+            queue.put(("Update",abort_stats.message()))
+
+        if backend.sensitivity is not None:
+            # The .SENS command is only for the optimizer, keep it out of the final netlist
+            backend.enable_sensitivities(target_value, None)
+            backend.write_netlist(netlist, {})
 
         optimal_netlist = netlist
         optimal_netlist.file_path = local_netlist_file
-        for changed_component in changing_components:
-            for netlist_component in optimal_netlist.components:
-                if changed_component.name == netlist_component.name:
-                    netlist_component.value = changed_component.value
-                    netlist_component.modified = True
-                    break
+        optimal_netlist.components.set_values(changing_components_names, transform.to_values(result.x))
 
         optimal_netlist.class_to_file(local_netlist_file)
 
         sys.stdout.flush()
         captured = sys.stdout.getvalue()
         lines = captured.split("\n")
-        line = next((item for item in lines if item.startswith("Function evaluations")), None)
-        values = line.split()
-        leastSquaresIterations = int(values[2].rstrip(","))
-        initialCost = float(values[5].rstrip(","))
-        finalCost = float(values[8].rstrip(","))
-        optimality = float(values[11].rstrip("."))
+        # One summary line per least_squares run (several when a Broyden run was restarted)
+        summaries = [item.split() for item in lines if item.startswith("Function evaluations")]
+        leastSquaresIterations = sum(int(values[2].rstrip(",")) for values in summaries)
+        initialCost = float(summaries[0][5].rstrip(","))
+        if resumed is not None:
+            # Count the interrupted run's part as well
+            leastSquaresIterations += resumed["function_evaluations"]
+            initialCost = float(f"{resumed['initial_cost']:.4e}")
+        finalCost = float(f"{result.cost:.5g}")
+        optimality = float(f"{result.optimality:.3g}")
+
+        if checkpoint is not None:
+            checkpoint.remove()
+        finished = True
 
     finally:
+        if pool is not None:
+            pool.close()
+        if checkpoint is not None and not finished:
+            # Failed or stopped, keep what was done so far for a resume
+            try:
+                save_checkpoint()
+            except OSError:
+                pass
         sys.stdout = old_stdout  # Restore stdout no matter what
     return [xyceRuns, leastSquaresIterations, initialCost, finalCost, optimality]
 
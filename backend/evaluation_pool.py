@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
+from backend.netlist_parse import Netlist
+from backend.simulator_backend import SimulatorBackend, AbortStats
+from backend.target_grid import TargetGrid
+from backend.constraint_engine import EqualityConstraintEngine
+from backend.residual_evaluation import simulate_component_values, compute_residuals
+
+"""
+Process pool that evaluates residual vectors for many parameter vectors at once.
+
+Every worker process gets its own copy of the Netlist object and its own scratch copy of the writable netlist in a
+private subdirectory next to it (inside the run's Workspace), so concurrent Xyce runs never write to the same
+netlist or .prn file. The subdirectory is removed when the worker process exits.
+"""
+
+# Per-process state filled in by _init_worker
+_worker_state = {}
+
+
+def _init_worker(backend, netlist, source_netlist_path, component_names, target_value, target_grid, node_constraints, constraint_engine):
+    scratch_dir = tempfile.mkdtemp(prefix="worker_", dir=os.path.dirname(os.path.abspath(source_netlist_path)))
+    util.Finalize(None, shutil.rmtree, args=(scratch_dir, True), exitpriority=0)
+    scratch_path = os.path.join(scratch_dir, os.path.basename(source_netlist_path))
+    shutil.copyfile(source_netlist_path, scratch_path)
+    # Workers start on their first task, by then the caller may have added .SENS to the netlist for its own runs.
+    # Workers only return residuals, so their copy never computes sensitivities
+    template = netlist.template_for(scratch_path)
+    template.set_command(".SENS", None)
+    template.set_command(".OPTIONS SENSITIVITY", None)
+
+    _worker_state["backend"] = backend.with_netlist_path(scratch_path)
+    # Forked workers inherit the parent's counts and listener, only this worker's own aborts are handed back and
+    # nothing is streamed to the caller's live plot
+    _worker_state["backend"].abort_stats = AbortStats()
+    _worker_state["backend"].stream_output(None)
+    _worker_state["netlist"] = netlist
+    _worker_state["component_names"] = component_names
+    _worker_state["target_value"] = target_value
+    _worker_state["target_grid"] = target_grid
+    _worker_state["node_constraints"] = node_constraints
+    _worker_state["constraint_engine"] = constraint_engine
+
+
+def _evaluate_point(component_values):
+    columns = simulate_component_values(_worker_state["backend"], _worker_state["netlist"], _worker_state["component_names"],
+                                        component_values, _worker_state["constraint_engine"])
+    residual, _, _ = compute_residuals(columns, _worker_state["target_value"], _worker_state["target_grid"], _worker_state["node_constraints"])
+    # The worker's early abort counts travel back with every result
+    return residual, _worker_state["backend"].abort_stats.take()
+
+
+def _simulate_point(component_values):
+    columns = simulate_component_values(_worker_state["backend"], _worker_state["netlist"], _worker_state["component_names"],
+                                        component_values, _worker_state["constraint_engine"])
+    return columns, _worker_state["backend"].abort_stats.take()
+
+
+class EvaluationPool:
+    """Evaluates residual vectors for batches of parameter vectors on a pool of worker processes."""
+
+    def __init__(self, max_workers: int, backend: SimulatorBackend, netlist: Netlist, source_netlist_path: str, component_names: list, target_value: str,
+                 target_grid: TargetGrid, node_constraints: dict, constraint_engine: EqualityConstraintEngine):
+        """
+        Args:
+            max_workers: Number of worker processes (and therefore concurrent Xyce runs).
+            backend: Simulator backend, every worker uses a copy of it pointed at its own scratch netlist.
+            netlist: Netlist object copied into every worker.
+            source_netlist_path: Writable netlist (with .TRAN/.PRINT already written) that each worker copies.
+            component_names: Names of the components the parameter vectors map onto, in order.
+            target_value: Name of the Xyce output column being fit, e.g. 'V(2)'.
+            target_grid: Evaluation grid with the target curve sampled onto it.
+            node_constraints: Node value constraints, see curvefit_optimize.
+            constraint_engine: Compiled equality part constraints.
+        """
+        self.max_workers = max_workers
+        # Early aborts in the workers, see SimulatorBackend.enable_early_abort
+        self.abort_stats = AbortStats()
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(backend, netlist, source_netlist_path, component_names, target_value, target_grid, node_constraints, constraint_engine)
+        )
+
+    def evaluate(self, points: list) -> list:
+        """Returns the residual vector for every parameter vector in points, in order."""
+        residuals = []
+        for residual, abort_stats in self.executor.map(_evaluate_point, points):
+            residuals.append(residual)
+            self.abort_stats.add(abort_stats)
+        return residuals
+
+    def simulate(self, points: list) -> list:
+        """Returns the output columns for every parameter vector in points, in order, e.g. to cache them."""
+        results = []
+        for columns, abort_stats in self.executor.map(_simulate_point, points):
+            results.append(columns)
+            self.abort_stats.add(abort_stats)
+        return results
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
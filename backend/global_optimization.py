@@ -0,0 +1,113 @@
+import numpy as np
+from scipy.optimize import differential_evolution
+from backend.netlist_parse import Netlist
+from backend.curvefit_optimization import curvefit_optimize
+from backend.residual_evaluation import simulate_component_values, compute_residuals, LiveWaveform
+from backend.simulator_backend import SimulatorBackend, XyceBackend, AbortStats
+from backend.evaluation_pool import EvaluationPool
+from backend.multistart_optimization import sampling_box
+from backend.target_grid import TargetGrid
+from backend.constraint_engine import EqualityConstraintEngine
+from backend.parameter_transform import LogTransform
+
+"""
+Global search with differential evolution, followed by a local curvefit_optimize refinement.
+
+The objective is the least squares cost 0.5 * sum(residual^2), searched over the component bounds (see sampling_box)
+in LogTransform coordinates. differential_evolution runs vectorized with deferred updating, so every generation
+arrives as one batch of parameter vectors, which an EvaluationPool simulates concurrently (workers > 1) or the calling
+process simulates one after another. The netlist's current values are part of the first generation. The best
+candidate found then seeds a normal curvefit_optimize run for the final, precise fit.
+"""
+
+
+def global_optimize(target_value: str, target_curve_rows: list, netlist: Netlist, writable_netlist_path: str, node_constraints: dict, equality_part_constraints: list, queue, custom_xtol= 1e-12, custom_gtol= 1e-12, custom_ftol= 1e-12, workers= 1, population_size= 15, generations= 30, backend: SimulatorBackend = None, jacobian_mode= "finite-difference", seed= 0, parameter_transform= "linear", live_plot= False) -> list:
+    """Differential evolution over the component bounds, refined with curvefit_optimize.
+
+    Args:
+        workers: Number of worker processes evaluating each generation (and the refinement's Jacobians).
+        population_size: differential_evolution popsize, the population has population_size * n members.
+        generations: Largest number of generations.
+        seed: Seed of differential_evolution.
+        live_plot: Stream every run's waveform to the queue while it is simulated, for the GUI's live plot.
+
+    Returns:
+        [simulations in both phases, refinement iterations, cost at the netlist's starting values, final cost, optimality]
+    """
+    target_grid = TargetGrid(target_curve_rows)
+    if backend is None:
+        backend = XyceBackend(writable_netlist_path)
+    backend.output_columns = ["TIME", target_value] + list(node_constraints)
+    backend.enable_early_abort(node_constraints)
+    backend.stream_output(LiveWaveform(queue, target_value) if live_plot else None)
+
+    table = netlist.components
+    changing_indices = np.flatnonzero(table.variable_mask)
+    changing_components_names = [table[i].name for i in changing_indices]
+    start_values = table.values[changing_indices].copy()
+    lower, upper = sampling_box(start_values, table.min_vals[changing_indices], table.max_vals[changing_indices])
+    space = LogTransform(start_values, lower, upper)
+    search_lower, search_upper = space.search_bounds()
+    constraint_engine = EqualityConstraintEngine(table, equality_part_constraints)
+
+    simulations = 0
+    best = {"cost": np.inf, "values": start_values}
+    initial_cost = None
+
+    pool = None
+    try:
+        if workers > 1:
+            pool = EvaluationPool(workers, backend, netlist, writable_netlist_path, changing_components_names, target_value,
+                                  target_grid, node_constraints, constraint_engine)
+
+        def evaluate_serially(points):
+            residuals = []
+            for point in points:
+                columns = simulate_component_values(backend, netlist, changing_components_names, point, constraint_engine)
+                residual, X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE = compute_residuals(columns, target_value, target_grid, node_constraints)
+                queue.put(("UpdateYData",(X_ARRAY_FROM_XYCE,Y_ARRAY_FROM_XYCE)))
+                residuals.append(residual)
+            return residuals
+
+        def objective(population):
+            # Vectorized: population is n x S, one column per candidate
+            nonlocal simulations, initial_cost
+            points = [space.to_values(u) for u in population.T]
+            residuals = pool.evaluate(points) if pool is not None else evaluate_serially(points)
+            simulations += len(points)
+            costs = np.array([0.5 * float(np.dot(residual, residual)) for residual in residuals])
+            queue.put(("UpdateCost",costs.tolist()))
+            if initial_cost is None:
+                # The first member of the first generation is the netlist's starting point (x0 below)
+                initial_cost = costs[0]
+            if costs.min() < best["cost"]:
+                best["cost"] = costs.min()
+                best["values"] = points[int(np.argmin(costs))]
+            queue.put(("Update",f"total runs completed: {simulations}"))
+            return costs
+
+        def callback(xk, convergence):
+            queue.put(("Update",f"generation best cost {best['cost']:.5g}, convergence {convergence:.3g}"))
+
+        x0 = np.clip(space.to_search(start_values), search_lower, search_upper)
+        differential_evolution(objective, list(zip(search_lower, search_upper)), popsize=population_size, maxiter=generations,
+                               vectorized=True, updating="deferred", polish=False, seed=seed, x0=x0, callback=callback)
+        if backend.node_watch is not None:
+            abort_stats = AbortStats()
+            abort_stats.add(backend.abort_stats.take())
+            if pool is not None:
+                abort_stats.add(pool.abort_stats)
+            queue.put(("Update",f"global search {abort_stats.message()}"))
+    finally:
+        if pool is not None:
+            pool.close()
+    queue.put(("Update",f"global search done after {simulations} simulations, best cost {best['cost']:.5g}, refining"))
+
+    # Local refinement from the best candidate, inside the real bounds
+    table.set_values(changing_components_names, np.clip(best["values"], table.min_vals[changing_indices], table.max_vals[changing_indices]))
+    netlist.file_path = writable_netlist_path
+    netlist.class_to_file(writable_netlist_path)
+    refined = curvefit_optimize(target_value, target_curve_rows, netlist, writable_netlist_path, node_constraints, equality_part_constraints,
+                                queue, custom_xtol, custom_gtol, custom_ftol, jacobian_workers=workers, backend=backend, jacobian_mode=jacobian_mode,
+                                parameter_transform=parameter_transform, live_plot=live_plot)
+    return [simulations + refined[0], refined[1], float(f"{initial_cost:.5g}"), refined[3], refined[4]]
@@ -0,0 +1,206 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+from backend.batch_job import run_job
+
+"""
+Runs many optimization jobs (see batch_job.py) at once over one bounded set of simulator slots.
+
+Every job is a complete optimizeProcess run in a process of its own, so it keeps its own workspace, worker pool and
+globals. What the jobs share is the number of simulations running at any moment: every simulation, in a job's main
+process or in one of its Jacobian workers, first takes a slot from a FairShareSlots object living in a manager
+process and gives it back afterwards. With slots equal to the number of cores the machine stays busy while no job
+can crowd out the others.
+
+Fair share: a free slot goes to the waiting job with the fewest slots in use relative to its priority, so a job with
+priority 2 runs about twice as many simulations at once as a job with priority 1 while both have work queued. Jobs
+also start in priority order when there are more jobs than max_running. Each job reports its progress on a channel of
+its own (channel(job_id)), which is a plain queue the caller reads; an optional callback sees every message too.
+"""
+
+
+class FairShareSlots:
+    """Counting semaphore over simulator slots that hands free slots out by weighted fair share."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.condition = threading.Condition()
+        self.in_use = {}
+        self.weights = {}
+        self.granted = {}
+        self.waited = {}
+        self.waiting = []
+        self.tickets = 0
+
+    def register(self, job_id, weight: float) -> None:
+        with self.condition:
+            self.weights[job_id] = max(float(weight), 1e-9)
+            self.in_use.setdefault(job_id, 0)
+            self.granted.setdefault(job_id, 0)
+            self.waited.setdefault(job_id, 0.0)
+
+    def _next_ticket(self):
+        # The waiting request whose job would hold the smallest weighted share with one more slot, oldest first among
+        # equals. Counting the slot being handed out lets a heavier job win the tie when no job holds any.
+        return min(self.waiting, key=lambda request: ((self.in_use[request[1]] + 1) / self.weights[request[1]], request[0]))[0]
+
+    def acquire(self, job_id) -> None:
+        """Blocks until job_id may start a simulation."""
+        start = time.perf_counter()
+        with self.condition:
+            self.tickets += 1
+            request = (self.tickets, job_id)
+            self.waiting.append(request)
+            while sum(self.in_use.values()) >= self.total or self._next_ticket() != request[0]:
+                self.condition.wait()
+            self.waiting.remove(request)
+            self.in_use[job_id] += 1
+            self.granted[job_id] += 1
+            self.waited[job_id] += time.perf_counter() - start
+            # The next request in line may fit as well
+            self.condition.notify_all()
+
+    def release(self, job_id) -> None:
+        with self.condition:
+            self.in_use[job_id] -= 1
+            self.condition.notify_all()
+
+    def usage(self, job_id) -> tuple:
+        """(simulations started, seconds spent waiting for a slot) of job_id so far."""
+        with self.condition:
+            return self.granted.get(job_id, 0), self.waited.get(job_id, 0.0)
+
+
+class SlotManager(BaseManager):
+    pass
+
+
+SlotManager.register("FairShareSlots", FairShareSlots)
+
+
+class SlotClient:
+    """One job's handle on the shared slots, a context manager around one simulation. Picklable into workers."""
+
+    def __init__(self, slots, job_id):
+        self.slots = slots
+        self.job_id = job_id
+
+    def __enter__(self):
+        self.slots.acquire(self.job_id)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.slots.release(self.job_id)
+        return False
+
+
+class _JobChannel:
+    # Queue stand-in handed to optimizeProcess in the job process, tags every message with the job
+    def __init__(self, progress_queue, job_id):
+        self.progress_queue = progress_queue
+        self.job_id = job_id
+
+    def put(self, message):
+        self.progress_queue.put((self.job_id, message))
+
+
+def _run_scheduled_job(job_id, spec, slots, progress_queue, workers):
+    spec = dict(spec)
+    spec.setdefault("jacobian_workers", workers)
+    return run_job(spec, channel=_JobChannel(progress_queue, job_id), slots=SlotClient(slots, job_id))
+
+
+class JobScheduler:
+    """Queues optimization jobs and runs them concurrently over shared simulator slots."""
+
+    def __init__(self, slots: int = None, max_running: int = None):
+        """
+        Args:
+            slots: Largest number of simulations running at once over all jobs, one per core by default.
+            max_running: Largest number of jobs running at once, all of them by default. Jobs beyond it wait for a
+                running job to finish, highest priority first.
+        """
+        self.slots = slots or os.cpu_count() or 1
+        self.max_running = max_running
+        self.jobs = []
+        self.channels = {}
+
+    def submit(self, spec: dict, name: str = None, priority: float = None) -> int:
+        """Queues a job spec (as returned by load_job) and returns its job id.
+
+        The name and priority default to the spec's "name" and "priority" keys, then to job<number> and 1.
+        """
+        job_id = len(self.jobs)
+        name = name or spec.get("name") or f"job{job_id + 1}"
+        priority = float(priority if priority is not None else spec.get("priority", 1.0))
+        if priority <= 0:
+            raise ValueError(f"Job {name} has priority {priority}, priorities must be positive")
+        if "output_netlist" not in spec:
+            # Jobs on the same netlist must not overwrite each other's result
+            spec = dict(spec, output_netlist=f"{spec['netlist'][:-4]}Copy_{name}.txt")
+        self.jobs.append({"id": job_id, "name": name, "priority": priority, "spec": spec})
+        self.channels[job_id] = queue.Queue()
+        return job_id
+
+    def channel(self, job_id: int) -> queue.Queue:
+        """The progress messages of one job, in the same (type, value) form the GUI's queue gets."""
+        return self.channels[job_id]
+
+    def _forward(self, progress_queue, on_message):
+        # Sorts messages from the job processes onto their channels until the None sentinel arrives
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            job_id, message = message
+            self.channels[job_id].put(message)
+            if on_message is not None:
+                on_message(self.jobs[job_id]["name"], message)
+
+    def run(self, on_message=None) -> list:
+        """Runs every submitted job and returns their results (see run_job) in submission order.
+
+        Args:
+            on_message: Called as on_message(job name, (type, value)) for every progress message, from a thread.
+        """
+        if not self.jobs:
+            return []
+        running = min(self.max_running or len(self.jobs), len(self.jobs))
+        slot_manager = SlotManager()
+        slot_manager.start()
+        manager = multiprocessing.Manager()
+        results = [None] * len(self.jobs)
+        forwarder = None
+        try:
+            slots = slot_manager.FairShareSlots(self.slots)
+            for job in self.jobs:
+                slots.register(job["id"], job["priority"])
+            progress_queue = manager.Queue()
+            forwarder = threading.Thread(target=self._forward, args=(progress_queue, on_message), daemon=True)
+            forwarder.start()
+
+            with ProcessPoolExecutor(max_workers=running) as executor:
+                # The executor starts jobs in submission order, so submit the high priority ones first
+                order = sorted(self.jobs, key=lambda job: (-job["priority"], job["id"]))
+                futures = {executor.submit(_run_scheduled_job, job["id"], job["spec"], slots, progress_queue, self.slots): job
+                           for job in order}
+                for future, job in futures.items():
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"netlist": job["spec"]["netlist"], "status": "failed", "error": str(e)}
+                    simulations, waited = slots.usage(job["id"])
+                    result.update(name=job["name"], priority=job["priority"], simulations=simulations,
+                                  slot_wait_seconds=round(waited, 3))
+                    results[job["id"]] = result
+        finally:
+            if forwarder is not None:
+                progress_queue.put(None)
+                forwarder.join()
+            manager.shutdown()
+            slot_manager.shutdown()
+        return results
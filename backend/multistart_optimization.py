@@ -0,0 +1,194 @@
+import os
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.stats import qmc
+from backend.netlist_parse import Netlist
+from backend import curvefit_optimization
+from backend.curvefit_optimization import curvefit_optimize
+from backend.simulator_backend import SimulatorBackend, XyceBackend
+from backend.residual_evaluation import simulate_component_values, compute_residuals
+from backend.target_grid import TargetGrid
+from backend.constraint_engine import EqualityConstraintEngine
+from backend.xyce_parsing_function import OptimizationStopped
+
+"""
+Multi-start driver around curvefit_optimize.
+
+The starting points are the netlist's current values plus a Latin hypercube sample of the component bounds (in log
+space for positive bounds, so every decade gets its share of starts). Each start is a complete curvefit_optimize run
+in a worker process with its own copy of the Netlist and its own scratch netlist, all sharing one simulator setup.
+
+Workers cannot put on the caller's queue directly, so they report to a multiprocessing Manager queue and a thread in
+the calling process forwards everything onto the caller's queue, prefixing "Update" messages with the start they came
+from. Once a start finishes at or below target_cost the remaining starts are stopped (through a shared event checked
+before every simulation) and the ones that have not begun are cancelled.
+"""
+
+# Unbounded components are sampled between value / SAMPLE_FACTOR and value * SAMPLE_FACTOR
+SAMPLE_FACTOR = 10
+
+
+def sampling_box(values, lower_bounds, upper_bounds):
+    """Finite (lower, upper) box to sample in: the bounds, with value / SAMPLE_FACTOR and value * SAMPLE_FACTOR
+    standing in for a lower bound of 0 (or none) and a missing upper bound."""
+    values = np.asarray(values, dtype=float)
+    lower = np.where(np.isfinite(lower_bounds) & (np.asarray(lower_bounds) > 0), lower_bounds, values / SAMPLE_FACTOR)
+    upper = np.where(np.isfinite(upper_bounds), upper_bounds, values * SAMPLE_FACTOR)
+    return np.minimum(lower, upper), upper
+
+
+def starting_points(values, lower_bounds, upper_bounds, count: int, seed=0) -> np.ndarray:
+    """Returns count starting points: values itself followed by a Latin hypercube sample of the bounds."""
+    values = np.asarray(values, dtype=float)
+    lower, upper = sampling_box(values, lower_bounds, upper_bounds)
+    points = [values]
+    if count > 1:
+        sample = qmc.LatinHypercube(d=values.size, seed=seed).random(count - 1)
+        log = (lower > 0) & (upper > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_points = np.exp(np.log(lower) + sample * (np.log(upper) - np.log(lower)))
+        linear_points = lower + sample * (upper - lower)
+        points.extend(np.where(log, log_points, linear_points))
+    return np.array(points)
+
+
+def _run_start(index, start_values, target_value, target_curve_rows, netlist, writable_netlist_path, node_constraints,
+               equality_part_constraints, progress_queue, stop_event, tolerances, backend, jacobian_mode, parameter_transform, live_plot):
+    # One local solve in a worker process, in a scratch directory of its own next to the writable netlist
+    scratch_dir = tempfile.mkdtemp(prefix=f"start{index}_", dir=os.path.dirname(os.path.abspath(writable_netlist_path)))
+    try:
+        scratch_path = os.path.join(scratch_dir, os.path.basename(writable_netlist_path))
+        shutil.copyfile(writable_netlist_path, scratch_path)
+        table = netlist.components
+        changing_indices = np.flatnonzero(table.variable_mask)
+        table.set_values([table[i].name for i in changing_indices], start_values)
+        netlist.file_path = scratch_path
+        netlist.class_to_file(scratch_path)
+        try:
+            result = curvefit_optimize(target_value, target_curve_rows, netlist, scratch_path, node_constraints, equality_part_constraints,
+                                       progress_queue, *tolerances, jacobian_workers=1, backend=backend.with_netlist_path(scratch_path),
+                                       jacobian_mode=jacobian_mode, stop_event=stop_event, parameter_transform=parameter_transform,
+                                       live_plot=live_plot)
+        except OptimizationStopped:
+            # Still count the simulations the stopped run made
+            return index, None, None, curvefit_optimization.xyceRuns
+        return index, result, table.values.copy(), result[0]
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def _forward(progress_queue, queue):
+    # Relays worker messages onto the caller's queue until the None sentinel arrives
+    while True:
+        message = progress_queue.get()
+        if message is None:
+            return
+        start, (kind, payload) = message
+        if kind == "Update":
+            payload = f"[start {start + 1}] {payload}"
+        queue.put((kind, payload))
+
+
+class _TaggedQueue:
+    # Queue proxy wrapper that marks every message with the start that sent it
+    def __init__(self, progress_queue, start):
+        self.progress_queue = progress_queue
+        self.start = start
+
+    def put(self, message):
+        self.progress_queue.put((self.start, message))
+
+
+def _cost_at_netlist_values(target_value, target_curve_rows, netlist, node_constraints, equality_part_constraints, backend) -> float:
+    # Cost of one simulation at the netlist's current values, rounded like least_squares' report of its initial cost
+    table = netlist.components
+    changing_indices = np.flatnonzero(table.variable_mask)
+    columns = simulate_component_values(backend, netlist, [table[i].name for i in changing_indices], table.values[changing_indices].copy(),
+                                        EqualityConstraintEngine(table, equality_part_constraints))
+    residual, _, _ = compute_residuals(columns, target_value, TargetGrid(target_curve_rows), node_constraints)
+    return float(f"{0.5 * np.dot(residual, residual):.4e}")
+
+
+def multistart_optimize(target_value: str, target_curve_rows: list, netlist: Netlist, writable_netlist_path: str, node_constraints: dict, equality_part_constraints: list, queue, custom_xtol= 1e-12, custom_gtol= 1e-12, custom_ftol= 1e-12, starts= 8, workers= None, target_cost= None, backend: SimulatorBackend = None, jacobian_mode= "finite-difference", seed= 0, parameter_transform= "linear", live_plot= False) -> list:
+    """Runs curvefit_optimize from several starting points concurrently and keeps the best result.
+
+    Args:
+        starts: Number of starting points, the netlist's current values being the first.
+        workers: Number of concurrent starts, every core by default.
+        target_cost: Stop the remaining starts once one finishes at or below this cost. None runs every start.
+        seed: Seed of the Latin hypercube sample.
+        live_plot: Stream every run's waveform to the queue while it is simulated, for the GUI's live plot.
+
+    Returns:
+        [total simulations over all starts, iterations, initial cost, final cost, optimality], the last three of the
+        best start and the initial cost at the netlist's own values (the first start).
+    """
+    if backend is None:
+        backend = XyceBackend(writable_netlist_path)
+    table = netlist.components
+    changing_indices = np.flatnonzero(table.variable_mask)
+    points = starting_points(table.values[changing_indices], table.min_vals[changing_indices], table.max_vals[changing_indices], starts, seed)
+    workers = min(workers or os.cpu_count() or 1, len(points))
+    tolerances = (custom_xtol, custom_gtol, custom_ftol)
+
+    manager = multiprocessing.Manager()
+    forwarder = None
+    try:
+        progress_queue = manager.Queue()
+        stop_event = manager.Event()
+        forwarder = threading.Thread(target=_forward, args=(progress_queue, queue), daemon=True)
+        forwarder.start()
+        queue.put(("Update",f"multi-start: {len(points)} starts on {workers} workers"))
+
+        results = {}
+        final_values = {}
+        total_runs = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_run_start, i, point, target_value, target_curve_rows, netlist, writable_netlist_path, node_constraints,
+                                       equality_part_constraints, _TaggedQueue(progress_queue, i), stop_event, tolerances, backend, jacobian_mode,
+                                       parameter_transform, live_plot)
+                       for i, point in enumerate(points)]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                index, result, values, runs = future.result()
+                total_runs += runs
+                if result is None:
+                    continue
+                results[index] = result
+                final_values[index] = values
+                queue.put(("Update",f"start {index + 1} finished with cost {result[3]}"))
+                if target_cost is not None and result[3] <= target_cost and not stop_event.is_set():
+                    queue.put(("Update",f"start {index + 1} reached the target cost {target_cost}, stopping the other starts"))
+                    stop_event.set()
+                    for other in futures:
+                        other.cancel()
+        progress_queue.put(None)
+        forwarder.join()
+    finally:
+        manager.shutdown()
+
+    if not results:
+        raise OptimizationStopped("No multi-start run finished")
+    best = min(results, key=lambda index: results[index][3])
+    queue.put(("Update",f"best result from start {best + 1} of {len(points)}"))
+
+    if 0 in results:
+        initial_cost = results[0][2]
+    else:
+        # The start from the netlist's own values was stopped before it finished, simulate them once for the initial
+        # cost before the best start's values replace them
+        initial_cost = _cost_at_netlist_values(target_value, target_curve_rows, netlist, node_constraints, equality_part_constraints, backend)
+        total_runs += 1
+
+    # Write the best start's values (equality constrained components included) into the caller's netlist
+    table.values[:] = final_values[best]
+    table.modified_mask[:] = True
+    netlist.file_path = writable_netlist_path
+    netlist.class_to_file(writable_netlist_path)
+
+    return [total_runs, results[best][1], initial_cost, results[best][3], results[best][4]]
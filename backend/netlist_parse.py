@@ -2,23 +2,191 @@ import numpy as np
 
 # Class Declaration
 class Component:
+    # A component keeps its own values until it is added to a ComponentTable, after that value, variable, modified, minVal and maxVal
+    # are read from and written to the table's arrays so both views always agree.
+    __slots__ = ("name", "type", "table", "index", "_value", "_variable", "_modified", "_minVal", "_maxVal")
+
     def __init__(self, name="", type="", value=0, variable=False, modified=False, minVal = -1, maxVal = np.inf):
         self.name = name
         self.type = type
-        self.value = value
-        self.variable = variable
-        self.modified = modified
-        self.minVal = minVal
-        self.maxVal = maxVal
+        self.table = None
+        self.index = -1
+        self._value = value
+        self._variable = variable
+        self._modified = modified
+        self._minVal = minVal
+        self._maxVal = maxVal
+
+    def _table_field(field):
+        def getter(self):
+            if self.table is None:
+                return getattr(self, "_" + field)
+            return getattr(self.table, ComponentTable.FIELDS[field])[self.index].item()
+        def setter(self, value):
+            if self.table is None:
+                setattr(self, "_" + field, value)
+            else:
+                getattr(self.table, ComponentTable.FIELDS[field])[self.index] = value
+        return property(getter, setter)
+
+    value = _table_field("value")
+    variable = _table_field("variable")
+    modified = _table_field("modified")
+    minVal = _table_field("minVal")
+    maxVal = _table_field("maxVal")
+    del _table_field
+
+class ComponentTable:
+    # Netlist components stored column-wise: a name -> index map plus NumPy arrays of values, bounds and flags.
+    # Iterating yields Component objects like the plain list it replaces, but lookups by name are O(1) and bounds work can be vectorized.
+    FIELDS = {"value": "values", "variable": "variable_mask", "modified": "modified_mask", "minVal": "min_vals", "maxVal": "max_vals"}
+
+    def __init__(self, components=()):
+        self.components = []
+        self.index = {}
+        self.types = np.empty(0, dtype="<U1")
+        self.values = np.empty(0)
+        self.variable_mask = np.empty(0, dtype=bool)
+        self.modified_mask = np.empty(0, dtype=bool)
+        self.min_vals = np.empty(0)
+        self.max_vals = np.empty(0)
+        for component in components:
+            self.append(component)
+
+    def append(self, component):
+        values = (component.value, component.variable, component.modified, component.minVal, component.maxVal)
+        position = len(self.components)
+        self.components.append(component)
+        self.index[component.name] = position
+        self.types = np.append(self.types, component.type[:1])
+        self.values = np.append(self.values, float(values[0]))
+        self.variable_mask = np.append(self.variable_mask, bool(values[1]))
+        self.modified_mask = np.append(self.modified_mask, bool(values[2]))
+        self.min_vals = np.append(self.min_vals, float(values[3]))
+        self.max_vals = np.append(self.max_vals, float(values[4]))
+        component.table = self
+        component.index = position
+
+    def __iter__(self):
+        return iter(self.components)
+
+    def __len__(self):
+        return len(self.components)
+
+    def __getitem__(self, position):
+        return self.components[position]
+
+    def __contains__(self, name):
+        return name in self.index
+
+    @property
+    def names(self) -> list:
+        return [component.name for component in self.components]
+
+    def get(self, name):
+        position = self.index.get(name)
+        return None if position is None else self.components[position]
+
+    def indices(self, names) -> np.ndarray:
+        # Positions of the named components, names not in the table are skipped
+        return np.array([self.index[name] for name in names if name in self.index], dtype=np.intp)
+
+    def set_values(self, names, values):
+        positions = np.array([self.index[name] for name in names], dtype=np.intp)
+        self.values[positions] = values
+        self.modified_mask[positions] = True
+
+    def values_dict(self) -> dict:
+        return dict(zip(self.names, self.values.tolist()))
+
+    def apply_default_bounds(self, types, factor=10):
+        # Components of the given types without a user bound get value/factor .. value*factor
+        mask = np.isin(self.types, list(types))
+        no_min = mask & (self.min_vals == -1)
+        no_max = mask & np.isinf(self.max_vals)
+        self.min_vals[no_min] = self.values[no_min] / factor
+        self.max_vals[no_max] = self.values[no_max] * factor
+
+class NetlistTemplate:
+    # Parsed copy of a netlist file used by Netlist.class_to_file.
+    # Blank lines and .CONTROL blocks are dropped once, and the line holding each top level component (outside .SUBCKT definitions) is remembered,
+    # so setting a component value only re-renders that one line and writing the netlist is a single join of the cached lines.
+    def __init__(self, file_path, component_names):
+        self.file_path = file_path
+        self.lines = []
+        self.slots = {}
+        with open(file_path,"r") as file:
+            data = file.readlines()
+        ctrl = False
+        subCkt = False
+        names = set(component_names)
+        for line in data:
+            lineData = line.strip().split()
+            if(not lineData):
+                continue
+            #ignore lines in the unsuppotred .CONTROL directive
+            if(lineData[0].upper() == ".CONTROL"):
+                ctrl = True
+            if(ctrl):
+                if(lineData[0].upper() == ".ENDC"):
+                    ctrl = False
+                continue
+            if(lineData[0].upper() == ".SUBCKT"):
+                subCkt = True
+            elif(lineData[0].upper() == ".ENDS"):
+                subCkt = False
+            elif(not subCkt and lineData[0] in names and lineData[0] not in self.slots and len(lineData) >= 4):
+                # Remember everything around the value field: name and nodes before it, any trailing parameters after it
+                self.slots[lineData[0]] = (len(self.lines), " ".join(lineData[:3]), " ".join(lineData[4:]))
+            self.lines.append(line)
+
+    def set_value(self, name, value):
+        if name not in self.slots:
+            return
+        index, prefix, suffix = self.slots[name]
+        self.lines[index] = f"{prefix} {float(value)} {suffix}\n" if suffix else f"{prefix} {float(value)}\n"
+
+    def replace_command(self, keyword, new_line):
+        # Replaces every top level command line starting with keyword (e.g. ".PRINT")
+        for i, line in enumerate(self.lines):
+            lineData = line.split()
+            if lineData and lineData[0].upper() == keyword.upper():
+                self.lines[i] = new_line
+
+    def set_command(self, keyword, new_line):
+        # Like replace_command, but keyword may span several words (e.g. ".OPTIONS SENSITIVITY") and a missing command
+        # is added before .END. new_line=None removes the command instead
+        words = keyword.upper().split()
+        matches = [i for i, line in enumerate(self.lines) if line.upper().split()[:len(words)] == words]
+        if matches and new_line is not None:
+            self.lines[matches[0]] = new_line
+            matches = matches[1:]
+        elif new_line is not None:
+            end = next((i for i, line in enumerate(self.lines) if line.split()[0].upper() == ".END"), len(self.lines))
+            self._insert_line(end, new_line)
+        for i in reversed(matches):
+            self._remove_line(i)
+
+    def _insert_line(self, index, line):
+        self.lines.insert(index, line)
+        self.slots = {name: (i + (i >= index), prefix, suffix) for name, (i, prefix, suffix) in self.slots.items()}
+
+    def _remove_line(self, index):
+        del self.lines[index]
+        self.slots = {name: (i - (i > index), prefix, suffix) for name, (i, prefix, suffix) in self.slots.items()}
+
+    def render(self) -> str:
+        return "".join(self.lines)
 
 class Netlist:
     def __init__(self, file_path):
         self.components, self.nodes = self.parse_file(file_path)
         self.file_path = file_path
+        self.template = None
 
     def parse_file(self, file_path) -> list:
     # Current Behavior: Parses file for RLC values to place into netlist's list. Skips Title Line, Commands, and non RLC components
-        components = []
+        components = ComponentTable()
         nodes = set()
         try:
             with open(file_path,"r") as file:
@@ -76,45 +244,26 @@ class Netlist:
         return [components,nodes]
     
     def class_to_file(self, file_path):
-    # Current Behavior: Reads in specified file and updates lines matching lines in the netlist class that have been marked as modified with the new value.
+    # Current Behavior: Updates the lines of components marked as modified with their new value and writes the netlist to the specified file.
+    # The file is only read the first time it is written to (see NetlistTemplate), after that only the changed lines are re-rendered.
         try:
-            # Get Current file netlist and modified components in class
-            with open(file_path,"r") as file:
-                data = file.readlines()
-            modifiedComponents = []
-            for component in self.components:
-                if component.modified == True:
-                    modifiedComponents.append(component)
-                    component.modified = False
-            # Generate updated netlist
-            updatedData=[]
-            ctrl = False
-            for line in data:
-                lineData = line.strip().split()
-                if(not lineData):
-                    continue
-                #ignore lines in the unsuppotred .CONTROL directive
-                if(lineData[0].upper() == ".CONTROL"):
-                    ctrl = True
-                if(lineData[0].upper() == ".ENDC"):
-                    ctrl = False
-                if(ctrl):
-                    continue
-                
-                for component in modifiedComponents:
-                    if lineData[0] == component.name:
-                        lineData[3] = component.value
-                        line = f"{lineData[0]} {lineData[1]} {lineData[2]} {float(lineData[3])}\n"
-                        modifiedComponents.remove(component)
-                        break
-                updatedData.append(line)
+            self.template_for(file_path)
+            for position in np.flatnonzero(self.components.modified_mask):
+                self.template.set_value(self.components[position].name, self.components.values[position])
+            self.components.modified_mask[:] = False
             with open(file_path,"w") as file:
-                file.writelines(updatedData)
+                file.write(self.template.render())
         except FileNotFoundError:
             print(f"Error: The file '{file_path}' was not found.")
         except Exception as e:
             print(f"An error occurred: {e}")
 
+    def template_for(self, file_path) -> NetlistTemplate:
+    # Returns the template class_to_file renders file_path from, reading the file if there is none for it yet
+        if self.template is None or self.template.file_path != file_path:
+            self.template = NetlistTemplate(file_path, [component.name for component in self.components])
+        return self.template
+
     def componentValConversion(self, strVal):
         data = {
         'Y': 24,
@@ -144,11 +293,12 @@ class Netlist:
         else:
             return float(strVal)
         
-    def writeTranCmdsToFile(self,file_path,initial_step_value,final_time_value,start_time_value,step_ceiling_value,target_node,constrained_nodes):
+    def writeTranCmdsToFile(self,file_path,initial_step_value,final_time_value,start_time_value,step_ceiling_value,target_node,constrained_nodes,print_interval_value=None):
         # the first arg is the file path
         # the next four args are a string with scientfic notation prefixes ie 10n, 0.001n, 10m (this is just 10 seconds)
         # target node is the name of the node that gets printed to xyce output as a string
         # constrained nodes are non target nodes that need to be printed to ensure constraints are met
+        # print interval (optional) makes xyce print at fixed intervals instead of at every time step
         try:
             with open(file_path,"r") as file:
                 data = file.readlines()
@@ -164,15 +314,23 @@ class Netlist:
                 if(values[0].upper() == ".PRINT"):
                     print("print command detected already Removing from copy...")
                     continue
+                if(print_interval_value is not None and values[0].upper() == ".OPTIONS" and len(values) > 1 and values[1].upper() == "OUTPUT"):
+                    print("output options detected already. Removing from copy...")
+                    continue
                 newData.append(line)
             print_command_string = f".PRINT TRAN {target_node} {' '.join(constrained_nodes)}\n"
             tran_command_string = f".TRAN {initial_step_value}s {final_time_value}s {start_time_value}s {step_ceiling_value}s\n"
             
             newData.insert(1,print_command_string)
+            if print_interval_value is not None:
+                newData.insert(1,f".OPTIONS OUTPUT INITIAL_INTERVAL={print_interval_value}s\n")
             newData.insert(1,tran_command_string)
 
             with open(file_path,"w") as file:
                 file.writelines(newData)
+            # The file changed underneath the cached template, re-read it on the next class_to_file
+            if self.template is not None and self.template.file_path == file_path:
+                self.template = None
         except FileNotFoundError:
             print(f"Error: The file '{file_path}' was not found.")
         except Exception as e:
@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+import signal
+import tempfile
+import multiprocessing as mp
+from backend.optimzation_process import optimizeProcess
+from backend.workspace import SCRATCH_ENV_VAR, default_scratch_root
+
+"""
+Runs optimizeProcess in a process of its own, so the GUI keeps its interpreter (and the GIL and sys.stdout) to itself
+and the run can be paused, resumed and cancelled.
+
+The optimization process makes itself the leader of a new process group. Everything it starts (Xyce runs, evaluation
+pool workers, multi-start workers and their manager) inherits the group, so one signal to the group reaches all of
+them at once:
+
+- pause() stops the whole group (SIGSTOP) and resume() continues it (SIGCONT), Xyce runs included
+- cancel() kills the whole group (SIGKILL), so no Xyce run outlives the cancellation
+
+A killed run cannot clean up after itself, so the runner gives it a scratch root of its own (through the
+XYCLOPS_SCRATCH variable, see workspace.py) and removes it afterwards.
+
+Progress goes through a ProgressChannel (see progress_channel.py), which can be read while the run is stopped.
+Pausing and process groups need POSIX. Elsewhere pause() is unavailable (supports_pause is False) and cancel() only
+terminates the optimization process itself.
+"""
+
+
+def _run_optimization(queue, scratch_root, args, kwargs):
+    if hasattr(os, "setpgid"):
+        os.setpgid(0, 0)
+    os.environ[SCRATCH_ENV_VAR] = scratch_root
+    optimizeProcess(queue, *args, **kwargs)
+    sys.stdout.flush()
+
+
+class OptimizationRunner:
+    """One optimizeProcess run in a separate process, with pause, resume and cancel."""
+
+    supports_pause = hasattr(os, "killpg")
+
+    def __init__(self, queue, args: tuple, kwargs: dict = None):
+        """
+        Args:
+            queue: Where the run reports progress, normally a ProgressChannel.
+            args: optimizeProcess's positional arguments after the queue.
+            kwargs: optimizeProcess's keyword arguments.
+        """
+        self.queue = queue
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.process = None
+        self.scratch_root = None
+        self.state = "new"
+
+    def start(self) -> None:
+        self.scratch_root = tempfile.mkdtemp(prefix="xyclops_runner_", dir=default_scratch_root())
+        # Not daemonic, daemonic processes may not start the evaluation pool's workers
+        self.process = mp.Process(target=_run_optimization, args=(self.queue, self.scratch_root, self.args, self.kwargs))
+        self.process.start()
+        if hasattr(os, "setpgid"):
+            # The child does the same, whichever runs first makes sure signals never miss the group
+            try:
+                os.setpgid(self.process.pid, self.process.pid)
+            except OSError:
+                pass
+        self.state = "running"
+
+    def _signal_group(self, signal_number) -> None:
+        try:
+            os.killpg(self.process.pid, signal_number)
+        except ProcessLookupError:
+            # Already gone
+            pass
+
+    def pause(self) -> None:
+        if self.state == "running" and self.supports_pause:
+            self._signal_group(signal.SIGSTOP)
+            self.state = "paused"
+
+    def resume(self) -> None:
+        if self.state == "paused":
+            self._signal_group(signal.SIGCONT)
+            self.state = "running"
+
+    def cancel(self) -> None:
+        """Stops the run and every simulation it started at once. Does nothing once the run has ended."""
+        if self.state not in ("running", "paused"):
+            return
+        if self.supports_pause:
+            self._signal_group(signal.SIGKILL)
+        else:
+            self.process.terminate()
+        self.process.join()
+        self.state = "cancelled"
+        self._cleanup()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def finished(self) -> bool:
+        """True once the run has ended on its own (check exitcode for how), cleaning up after it the first time."""
+        if self.state in ("running", "paused") and not self.process.is_alive():
+            self.process.join()
+            self.state = "finished"
+            self._cleanup()
+        return self.state == "finished"
+
+    @property
+    def exitcode(self):
+        return None if self.process is None else self.process.exitcode
+
+    def _cleanup(self) -> None:
+        if self.scratch_root is not None:
+            shutil.rmtree(self.scratch_root, ignore_errors=True)
+            self.scratch_root = None
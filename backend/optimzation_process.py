@@ -1,7 +1,15 @@
 
+import os
 import shutil
-import numpy as np
 from backend.curvefit_optimization import curvefit_optimize
+from backend.surrogate_optimization import surrogate_optimize
+from backend.multistart_optimization import multistart_optimize
+from backend.global_optimization import global_optimize
+from backend.workspace import Workspace
+from backend.simulator_backend import make_backend
+from backend.constraint_engine import compile_expression
+from backend.tran_planner import plan_transient
+from backend.checkpoint import CheckpointError, checkpoint_path_for
 
 def add_part_constraints(constraints, netlist):
     equalConstraints = []
@@ -11,31 +19,27 @@ def add_part_constraints(constraints, netlist):
             left = constraint["left"].strip()
             right = constraint["right"].strip()
 
-            componentVals = {}
-            for component in netlist.components:
-                componentVals[component.name] = component.value
-            for component in netlist.components:
-                if left == component.name:
-                    match constraint["operator"]:
-                        case ">=":
-                            component.minVal = eval(right, componentVals)
-                            if component.value <= component.minVal:
-                                component.value = component.minVal + 1
-                                component.modified = True
-                            print(f"{component.name} minVal set to {component.minVal}")
-                        case "=":
-                            component.value = eval(right, componentVals)
-                            component.variable = False
+            component = netlist.components.get(left)
+            if component is not None:
+                match constraint["operator"]:
+                    case ">=":
+                        component.minVal = compile_expression(right, netlist.components)(netlist.components.values)
+                        if component.value <= component.minVal:
+                            component.value = component.minVal + 1
                             component.modified = True
-                            equalConstraints.append(constraint)
-                            print(f"{component.name} set to {component.value}")
-                        case "<=":
-                            component.maxVal = eval(right, componentVals)
-                            if component.value >= component.maxVal:
-                                component.value = component.maxVal - 1
-                                component.modified = True
-                            print(f"{component.name} maxVal set to {component.maxVal}")
-                    break
+                        print(f"{component.name} minVal set to {component.minVal}")
+                    case "=":
+                        component.value = compile_expression(right, netlist.components)(netlist.components.values)
+                        component.variable = False
+                        component.modified = True
+                        equalConstraints.append(constraint)
+                        print(f"{component.name} set to {component.value}")
+                    case "<=":
+                        component.maxVal = compile_expression(right, netlist.components)(netlist.components.values)
+                        if component.value >= component.maxVal:
+                            component.value = component.maxVal - 1
+                            component.modified = True
+                        print(f"{component.name} maxVal set to {component.maxVal}")
     return equalConstraints
     
 
@@ -56,55 +60,46 @@ def add_node_constraints(constraints):
         formattedNodeConstraints[node] = (nodes[node][0],nodes[node][1])
     return formattedNodeConstraints
 
-def optimizeProcess(queue,curveData,testRows,netlistPath,netlistObject,selectedParameters,optimizationTolerances,RLCBounds):
+def optimizeProcess(queue,curveData,testRows,netlistPath,netlistObject,selectedParameters,optimizationTolerances,RLCBounds,jacobianWorkers=None,simulator="xyce",jacobianMode="finite-difference",engine="least-squares",maxSimulations=100,starts=8,targetCost=None,generations=30,parameterTransform="linear",tranPreset="balanced",outputNetlistPath=None,simulatorSlots=None,checkpointPath=None,resume=False,livePlot=False):
+    workspace = None
+    CHECKPOINT_PATH = None
     try:        
         TARGET_VALUE = curveData["y_parameter"]
         TEST_ROWS = testRows
         ORIG_NETLIST_PATH = netlistPath
         NETLIST = netlistObject
-        WRITABLE_NETLIST_PATH = ORIG_NETLIST_PATH[:-4]+"Copy.txt"
+        #Every run simulates in its own scratch workspace, only the optimized netlist is written next to the original
+        workspace = Workspace(ORIG_NETLIST_PATH)
+        WRITABLE_NETLIST_PATH = workspace.netlist_path
+        OUTPUT_NETLIST_PATH = outputNetlistPath or ORIG_NETLIST_PATH[:-4]+"Copy.txt"
         NODE_CONSTRAINTS = add_node_constraints(curveData["constraints"]) 
+        #Least squares fits save their progress every so often and can resume from it (see checkpoint.py), only when
+        #the caller asks for it since nothing else would ever use or remove the file
+        if engine == "least-squares" and (checkpointPath is not None or resume):
+            CHECKPOINT_PATH = checkpointPath or checkpoint_path_for(OUTPUT_NETLIST_PATH)
+        elif resume:
+            queue.put(("Update", f"Only the least-squares engine can resume from a checkpoint, starting {engine} from the netlist's values"))
 
         print(f"TARGET_VALUE = {TARGET_VALUE}")
         print(f"ORIG_NETLIST_PATH = {ORIG_NETLIST_PATH}")
         print(f"NETLIST.file_path = {NETLIST.file_path}")
         print(f"WRIITABLE_NETLIST_PATH = {WRITABLE_NETLIST_PATH}")
+        print(f"OUTPUT_NETLIST_PATH = {OUTPUT_NETLIST_PATH}")
 
         #UPDATE NETLIST BASED ON OPTIMIZATION SETTINGS AND CONSTRAINTS
-        for component in NETLIST.components:
-            if component.name in selectedParameters:
-                component.variable = True
+        NETLIST.components.variable_mask[NETLIST.components.indices(selectedParameters)] = True
 
         #ADD IN INITIAL CONSTRAINTS TO NETLIST CLASS VIA MINVAL MAXVAL
         EQUALITY_PART_CONSTRAINTS = add_part_constraints(curveData["constraints"], NETLIST)
 
         #ADD DEFAULT BOUNDS IF USER WANTS THEM FOR COMPONENT TYPE AND THEY HAVEN'T BEEN SPECIFIED BY OTHER CONSTRAINT
-        for component in NETLIST.components:
-            match component.type:
-                case "R":
-                    if (RLCBounds[0]):
-                        if component.minVal == -1:
-                            component.minVal = component.value/10
-                        if component.maxVal == np.inf:
-                            component.maxVal = component.value*10
-                case "L":
-                    if (RLCBounds[1]):
-                        if component.minVal == -1:
-                            component.minVal = component.value/10
-                        if component.maxVal == np.inf:
-                            component.maxVal = component.value*10
-                case "C":
-                    if (RLCBounds[2]):
-                        if component.minVal == -1:
-                            component.minVal = component.value/10
-                        if component.maxVal == np.inf:
-                            component.maxVal = component.value*10
-            #If min is still -1 after match statement (Case where no bound specified in a constraint and default bounds not desired by user) set to 0.
-            if component.minVal == -1:
-                component.minVal = 0
+        NETLIST.components.apply_default_bounds([componentType for componentType, enabled in zip("RLC", RLCBounds) if enabled])
+        #If min is still -1 (Case where no bound specified in a constraint and default bounds not desired by user) set to 0.
+        NETLIST.components.min_vals[NETLIST.components.min_vals == -1] = 0
 
-        endValue = max([sublist[0] for sublist in TEST_ROWS])
-        initValue = min([sublist[0] for sublist in TEST_ROWS])
+        #Step ceiling, print interval and start time follow the target curve's sampling and bandwidth
+        TRAN_PLAN = plan_transient(TEST_ROWS, tranPreset)
+        queue.put(("Update", str(TRAN_PLAN)))
         shutil.copyfile(NETLIST.file_path, WRITABLE_NETLIST_PATH)
         NETLIST.class_to_file(WRITABLE_NETLIST_PATH)
         CONSTRAINED_NODES = []
@@ -112,9 +107,30 @@ def optimizeProcess(queue,curveData,testRows,netlistPath,netlistObject,selectedP
             if constraint["type"] == "node":
                 if constraint["left"].strip() != TARGET_VALUE:
                     CONSTRAINED_NODES.append(constraint["left"].strip())
-        NETLIST.writeTranCmdsToFile(WRITABLE_NETLIST_PATH,(endValue- initValue)/ 100,endValue,initValue,(endValue- initValue)/ 100,TARGET_VALUE,CONSTRAINED_NODES)
+        NETLIST.writeTranCmdsToFile(WRITABLE_NETLIST_PATH,TRAN_PLAN.initial_step,TRAN_PLAN.final_time,TRAN_PLAN.start_time,TRAN_PLAN.step_ceiling,TARGET_VALUE,CONSTRAINED_NODES,TRAN_PLAN.print_interval)
+        #The Jacobian process pool is opt in, by default every simulation runs in this process. Multi-start keeps its own
+        #default of one concurrent start per core
+        if jacobianWorkers is None and engine != "multi-start":
+            jacobianWorkers = 1
+        BACKEND = make_backend(simulator,WRITABLE_NETLIST_PATH)
+        #Simulations wait for a slot when several optimizations share the machine (see job_scheduler.py)
+        BACKEND.slots = simulatorSlots
+        if NODE_CONSTRAINTS and not BACKEND.can_stream:
+            queue.put(("Update", f"No early abort with {simulator} output, node constraints are only checked once a run completes"))
         #Optimization Call
-        optim = curvefit_optimize(TARGET_VALUE, TEST_ROWS, NETLIST, WRITABLE_NETLIST_PATH, NODE_CONSTRAINTS, EQUALITY_PART_CONSTRAINTS,queue,optimizationTolerances[0],optimizationTolerances[1],optimizationTolerances[2])
+        if engine == "surrogate":
+            #Surrogate engine for slow simulations, stays within maxSimulations Xyce runs
+            optim = surrogate_optimize(TARGET_VALUE, TEST_ROWS, NETLIST, WRITABLE_NETLIST_PATH, NODE_CONSTRAINTS, EQUALITY_PART_CONSTRAINTS,queue,optimizationTolerances[0],optimizationTolerances[1],optimizationTolerances[2],maxSimulations,backend=BACKEND,live_plot=livePlot)
+        elif engine == "multi-start":
+            #Independent local solves from several starting points inside the bounds, run concurrently
+            optim = multistart_optimize(TARGET_VALUE, TEST_ROWS, NETLIST, WRITABLE_NETLIST_PATH, NODE_CONSTRAINTS, EQUALITY_PART_CONSTRAINTS,queue,optimizationTolerances[0],optimizationTolerances[1],optimizationTolerances[2],starts,jacobianWorkers,targetCost,backend=BACKEND,jacobian_mode=jacobianMode,parameter_transform=parameterTransform,live_plot=livePlot)
+        elif engine == "global":
+            #Differential evolution over the bounds, every generation simulated as one parallel batch, then a least squares refinement
+            optim = global_optimize(TARGET_VALUE, TEST_ROWS, NETLIST, WRITABLE_NETLIST_PATH, NODE_CONSTRAINTS, EQUALITY_PART_CONSTRAINTS,queue,optimizationTolerances[0],optimizationTolerances[1],optimizationTolerances[2],jacobianWorkers,generations=generations,backend=BACKEND,jacobian_mode=jacobianMode,parameter_transform=parameterTransform,live_plot=livePlot)
+        else:
+            optim = curvefit_optimize(TARGET_VALUE, TEST_ROWS, NETLIST, WRITABLE_NETLIST_PATH, NODE_CONSTRAINTS, EQUALITY_PART_CONSTRAINTS,queue,optimizationTolerances[0],optimizationTolerances[1],optimizationTolerances[2],jacobianWorkers,backend=BACKEND,jacobian_mode=jacobianMode,parameter_transform=parameterTransform,checkpoint_path=CHECKPOINT_PATH,resume=resume,live_plot=livePlot)
+
+        workspace.export_netlist(OUTPUT_NETLIST_PATH)
 
         #Update AppData
         queue.put(("UpdateNetlist",NETLIST))
@@ -125,8 +141,15 @@ def optimizeProcess(queue,curveData,testRows,netlistPath,netlistObject,selectedP
         queue.put(("Update", f"Optimality: {optim[4]}"))
         queue.put(("Update", f"Final Cost: {optim[3]}"))
         queue.put(("Update", f"Initial Cost: {optim[2]}"))
-        queue.put(("Update", f"Least Squares Iterations: {optim[1]}"))
+        #The surrogate engine counts its own trust region iterations, the others least_squares' function evaluations
+        queue.put(("Update", f"{'Surrogate' if engine == 'surrogate' else 'Least Squares'} Iterations: {optim[1]}"))
         queue.put(("Update", f"Total Xyce Runs: {optim[0]}"))
+        queue.put(("Update", workspace.io_report(BACKEND)))
         queue.put(("Done", f"Optimization Results:"))
     except Exception as e:
-        queue.put(("Failed",f"{e}"))
\ No newline at end of file
+        if CHECKPOINT_PATH is not None and os.path.isfile(CHECKPOINT_PATH) and not isinstance(e, CheckpointError):
+            queue.put(("Update", f"Progress saved to {CHECKPOINT_PATH}, resume to continue from it"))
+        queue.put(("Failed",f"{e}"))
+    finally:
+        if workspace is not None:
+            workspace.cleanup()
\ No newline at end of file
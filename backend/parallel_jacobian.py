@@ -0,0 +1,84 @@
+import numpy as np
+
+"""
+Finite-difference Jacobian provider for least_squares that simulates all perturbed parameter vectors at once.
+
+least_squares(jac='3-point') evaluates the 2n perturbed points of every Jacobian one after another. ParallelJacobian
+builds the same central-difference matrix, but hands every perturbed point to evaluate_points in a single batch so
+they can be simulated concurrently (see EvaluationPool). Near a bound the central difference is replaced by a
+one-sided 3-point difference, like SciPy does, which needs the residual at x itself; that value is taken from the
+last residuals() call when it was made at the same x (least_squares always evaluates fun before jac).
+"""
+
+EPS = np.finfo(np.float64).eps
+
+
+class ParallelJacobian:
+    def __init__(self, evaluate_points, lower_bounds, upper_bounds):
+        """
+        Args:
+            evaluate_points: Callable taking a list of parameter vectors and returning their residual vectors, in order.
+            lower_bounds: Lower parameter bounds passed to least_squares.
+            upper_bounds: Upper parameter bounds passed to least_squares.
+        """
+        self.evaluate_points = evaluate_points
+        self.lower_bounds = np.asarray(lower_bounds, dtype=float)
+        self.upper_bounds = np.asarray(upper_bounds, dtype=float)
+        self.last_x = None
+        self.last_f = None
+        self.evaluations = 0
+
+    def remember(self, x, f) -> None:
+        """Records the residual at x so a later Jacobian at the same x can reuse it."""
+        self.last_x = np.array(x, dtype=float)
+        self.last_f = np.asarray(f, dtype=float)
+
+    def __call__(self, x, *args):
+        x = np.asarray(x, dtype=float)
+        h = EPS ** (1 / 3) * np.maximum(1.0, np.abs(x))
+
+        # Plan every column first so all points can be simulated in one batch
+        points = []
+        plan = []
+        for j in range(x.size):
+            step = np.zeros_like(x)
+            step[j] = h[j]
+            if x[j] - h[j] >= self.lower_bounds[j] and x[j] + h[j] <= self.upper_bounds[j]:
+                plan.append(("central", len(points), x[j] + h[j] - (x[j] - h[j])))
+                points.extend([x + step, x - step])
+            elif x[j] + 2 * h[j] <= self.upper_bounds[j]:
+                plan.append(("forward", len(points), h[j]))
+                points.extend([x + step, x + 2 * step])
+            elif x[j] - 2 * h[j] >= self.lower_bounds[j]:
+                plan.append(("backward", len(points), h[j]))
+                points.extend([x - step, x - 2 * step])
+            else:
+                # Bounds are tighter than the step, difference across the whole feasible interval instead
+                upper_point = x.copy()
+                lower_point = x.copy()
+                upper_point[j] = self.upper_bounds[j]
+                lower_point[j] = self.lower_bounds[j]
+                plan.append(("central", len(points), self.upper_bounds[j] - self.lower_bounds[j]))
+                points.extend([upper_point, lower_point])
+
+        need_f0 = any(kind in ("forward", "backward") for kind, _, _ in plan)
+        have_f0 = self.last_x is not None and np.array_equal(self.last_x, x)
+        if need_f0 and not have_f0:
+            points.append(x.copy())
+
+        results = self.evaluate_points(points)
+        self.evaluations += len(points)
+        f0 = results[-1] if need_f0 and not have_f0 else self.last_f
+
+        jacobian = np.empty((np.asarray(results[0]).size, x.size))
+        for j, (kind, index, dx) in enumerate(plan):
+            f1 = np.asarray(results[index])
+            f2 = np.asarray(results[index + 1])
+            match kind:
+                case "central":
+                    jacobian[:, j] = (f1 - f2) / dx
+                case "forward":
+                    jacobian[:, j] = (-3.0 * f0 + 4.0 * f1 - f2) / (2.0 * dx)
+                case "backward":
+                    jacobian[:, j] = (3.0 * f0 - 4.0 * f1 + f2) / (2.0 * dx)
+        return jacobian
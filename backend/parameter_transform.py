@@ -0,0 +1,101 @@
+import numpy as np
+
+"""
+Coordinate transforms between component values and the coordinates an optimizer searches in.
+
+Component values span many decades (nF capacitors next to MOhm resistors), which makes finite-difference steps and
+trust regions in raw units badly scaled. A transform maps the values (and their bounds) to better scaled search
+coordinates and back, the optimizer works in search coordinates and values are converted back before they are
+written to the netlist:
+
+- "linear": the raw values, unchanged
+- "log": u = log(x / x0) relative to the starting values, so every parameter moves by relative amounts
+- "normalized": u = (x - lower) / (upper - lower) for parameters with finite bounds, x / |x0| otherwise
+
+Parameters the log transform cannot handle (a starting value that is not positive) stay linear.
+"""
+
+
+class ParameterTransform:
+    """Identity transform, the base class of the others."""
+
+    name = "linear"
+
+    def __init__(self, start_values, lower_bounds, upper_bounds):
+        self.start_values = np.asarray(start_values, dtype=float)
+        self.lower_bounds = np.asarray(lower_bounds, dtype=float)
+        self.upper_bounds = np.asarray(upper_bounds, dtype=float)
+
+    def to_search(self, values) -> np.ndarray:
+        return np.array(values, dtype=float)
+
+    def _to_values(self, search) -> np.ndarray:
+        return np.array(search, dtype=float)
+
+    def to_values(self, search) -> np.ndarray:
+        """Component values for search coordinates, clipped to the bounds against round-off."""
+        return np.clip(self._to_values(np.asarray(search, dtype=float)), self.lower_bounds, self.upper_bounds)
+
+    def derivative(self, search) -> np.ndarray:
+        """d(value)/d(search coordinate) for each parameter, to convert Jacobians from values to search coordinates."""
+        return np.ones(np.shape(search))
+
+    def search_bounds(self):
+        """The bounds in search coordinates, as a (lower, upper) pair for least_squares."""
+        with np.errstate(divide="ignore"):
+            return self.to_search(self.lower_bounds), self.to_search(self.upper_bounds)
+
+
+class LogTransform(ParameterTransform):
+    name = "log"
+
+    def __init__(self, start_values, lower_bounds, upper_bounds):
+        super().__init__(start_values, lower_bounds, upper_bounds)
+        self.log = self.start_values > 0
+        self.reference = np.where(self.log, self.start_values, 1.0)
+
+    def to_search(self, values) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.log, np.log(np.where(self.log, np.maximum(values, 0.0), 1.0) / self.reference), values)
+
+    def _to_values(self, search) -> np.ndarray:
+        return np.where(self.log, self.reference * np.exp(np.where(self.log, search, 0.0)), search)
+
+    def derivative(self, search) -> np.ndarray:
+        return np.where(self.log, self._to_values(search), 1.0)
+
+
+class NormalizedTransform(ParameterTransform):
+    name = "normalized"
+
+    def __init__(self, start_values, lower_bounds, upper_bounds):
+        super().__init__(start_values, lower_bounds, upper_bounds)
+        bounded = np.isfinite(self.lower_bounds) & np.isfinite(self.upper_bounds) & (self.upper_bounds > self.lower_bounds)
+        self.offset = np.where(bounded, self.lower_bounds, 0.0)
+        scale = np.where(bounded, self.upper_bounds - self.lower_bounds, np.abs(self.start_values))
+        self.scale = np.where(scale > 0, scale, 1.0)
+
+    def to_search(self, values) -> np.ndarray:
+        return (np.asarray(values, dtype=float) - self.offset) / self.scale
+
+    def _to_values(self, search) -> np.ndarray:
+        return self.offset + search * self.scale
+
+    def derivative(self, search) -> np.ndarray:
+        return self.scale * np.ones(np.shape(search))
+
+
+TRANSFORMS = {
+    ParameterTransform.name: ParameterTransform,
+    LogTransform.name: LogTransform,
+    NormalizedTransform.name: NormalizedTransform,
+}
+
+
+def make_transform(name: str, start_values, lower_bounds, upper_bounds) -> ParameterTransform:
+    """Creates the transform registered under name ('linear', 'log' or 'normalized')."""
+    try:
+        return TRANSFORMS[name.lower()](start_values, lower_bounds, upper_bounds)
+    except KeyError:
+        raise ValueError(f"Unknown parameter transform '{name}', expected one of {', '.join(TRANSFORMS)}")
@@ -0,0 +1,234 @@
+import re
+import time
+import queue
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+"""
+Progress channel between a running optimization and the GUI, used in place of a plain multiprocessing queue.
+
+optimizeProcess puts ("UpdateYData", (X, Y)) after every simulation and a status message every few runs. Through a
+plain queue every waveform is pickled and queued even when the GUI only draws a few times a second, so on long
+transients the queue keeps growing and the plot falls further and further behind the run. ProgressChannel instead:
+
+- keeps only the latest waveform, copied into a shared memory buffer (header: sequence number and length, then the X
+  and Y values) under a lock. The GUI copies it out when it polls and skips it when the sequence number has not
+  changed. Waveforms longer than the buffer are reduced to it with decimate_minmax, which keeps every peak.
+- coalesces running counters: a status ("Update") message listed in COUNTER_MESSAGES (e.g. "total runs completed:
+  35") replaces the pending one of the same kind from the same sender (e.g. "[start 2] "). Every other status message
+  carries a result of its own and is always sent. Pending status messages are sent at most every status_interval
+  seconds.
+- collects the costs of ("UpdateCost", [cost, ...]) messages and sends them as one such message with every batch of
+  status messages.
+- sends the messages through a queue of at most backlog entries, and keeps at most backlog status messages waiting
+  for room in it. When the GUI falls that far behind the oldest pending status messages are dropped (and counted in
+  a status message) instead of piling up.
+
+Results, "Done" and "Failed" are never dropped or delayed: pending status messages are sent first so the order is
+kept, then they go through the queue, waiting for room if necessary.
+
+The process that creates the channel owns the shared memory and must close() it. The channel can be handed to a
+child process (e.g. a multiprocessing.Process argument), which attaches to the same buffer.
+"""
+
+# Largest waveform, in points, the shared buffer holds
+WAVEFORM_POINTS = 1 << 16
+
+# Largest number of messages waiting for the GUI
+BACKLOG = 256
+
+# Smallest number of seconds between two batches of status messages
+STATUS_INTERVAL = 0.1
+
+_HEADER_BYTES = 16
+
+# Pending key of the collected costs, counter keys are strings and other status messages are numbered
+_COSTS = ("UpdateCost",)
+
+# Status messages that only report a running count, a newer one makes the pending older one pointless
+COUNTER_MESSAGES = ("total runs completed:", "simulation cache:")
+
+_COUNTER = re.compile(r"^(\[start \d+\] )?(" + "|".join(re.escape(prefix) for prefix in COUNTER_MESSAGES) + ")")
+
+
+def decimate_minmax(x, y, points: int):
+    """Reduces a waveform to at most points points, keeping the lowest and highest y of every bucket in time order."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.size <= points:
+        return x, y
+    buckets = max(points // 2, 1)
+    edges = np.linspace(0, x.size, buckets + 1).astype(np.intp)
+    starts = edges[:-1]
+    lengths = np.diff(edges)
+    # Index of the minimum and maximum inside every bucket, all buckets at once through a padded 2D view
+    width = int(lengths.max())
+    index = np.minimum(starts[:, None] + np.arange(width), x.size - 1)
+    inside = np.arange(width) < lengths[:, None]
+    low = starts + np.argmin(np.where(inside, y[index], np.inf), axis=1)
+    high = starts + np.argmax(np.where(inside, y[index], -np.inf), axis=1)
+    keep = np.sort(np.concatenate([low, high]))
+    return x[keep], y[keep]
+
+
+class ProgressChannel:
+    """Queue stand-in for optimizeProcess (put) that the GUI reads with poll()."""
+
+    def __init__(self, waveform_points: int = WAVEFORM_POINTS, backlog: int = BACKLOG, status_interval: float = STATUS_INTERVAL):
+        self.capacity = waveform_points
+        self.backlog = backlog
+        self.status_interval = status_interval
+        self.messages = mp.Queue(backlog)
+        self.waveform_lock = mp.Lock()
+        self.memory = shared_memory.SharedMemory(create=True, size=_HEADER_BYTES + 16 * waveform_points)
+        self.owner = True
+        self._attach()
+        self.header[:] = 0
+
+    def _attach(self):
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.memory.buf)
+        self.x = np.ndarray((self.capacity,), dtype=np.float64, buffer=self.memory.buf, offset=_HEADER_BYTES)
+        self.y = np.ndarray((self.capacity,), dtype=np.float64, buffer=self.memory.buf, offset=_HEADER_BYTES + 8 * self.capacity)
+        # Producer side
+        self.producer_lock = threading.Lock()
+        self.pending = OrderedDict()
+        self.pending_costs = []
+        self.last_status = 0.0
+        self.dropped = 0
+        self.numbered = 0
+        # Consumer side
+        self.seen_sequence = 0
+
+    def __getstate__(self):
+        state = {key: self.__dict__[key] for key in ("capacity", "backlog", "status_interval", "messages", "waveform_lock")}
+        state["memory_name"] = self.memory.name
+        return state
+
+    def __setstate__(self, state):
+        memory_name = state.pop("memory_name")
+        self.__dict__.update(state)
+        self.memory = shared_memory.SharedMemory(name=memory_name)
+        # Only the creating process unlinks the buffer, keep the resource tracker from doing it when this one exits
+        resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.owner = False
+        self._attach()
+
+    # Producer side, called by the optimization
+
+    def put(self, message) -> None:
+        if self.memory is None:
+            return
+        msg_type, msg_value = message
+        if msg_type == "UpdateYData":
+            self._write_waveform(*msg_value)
+            with self.producer_lock:
+                self._send_status()
+            return
+        with self.producer_lock:
+            if msg_type == "UpdateCost":
+                self.pending_costs.extend(msg_value)
+                self._send_status()
+            elif msg_type == "Update":
+                counter = _COUNTER.match(str(msg_value))
+                if counter is not None:
+                    key = counter.group(0)
+                    self.pending.pop(key, None)
+                else:
+                    # Never replaced, numbered so it keeps its place
+                    self.numbered += 1
+                    key = self.numbered
+                self.pending[key] = message
+                if len(self.pending) > self.backlog:
+                    # Drops the oldest status message, a counter or not (a counter's latest value is always the newest)
+                    oldest = next(key for key in self.pending if isinstance(key, (str, int)))
+                    del self.pending[oldest]
+                    self.dropped += 1
+                self._send_status()
+            else:
+                self._send_status(force=True)
+                self.messages.put(message)
+
+    def _send_status(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not self.pending and not self.pending_costs and not self.dropped or not force and now - self.last_status < self.status_interval:
+            return
+        self.last_status = now
+        if self.pending_costs:
+            # Costs still waiting from an earlier batch go out together with the new ones
+            _, costs = self.pending.pop(_COSTS, (None, []))
+            self.pending[_COSTS] = ("UpdateCost", costs + self.pending_costs)
+            self.pending_costs = []
+        if self.dropped:
+            # Counted until the note is sent, a note still waiting keeps its place and gets the new count
+            self.pending[None] = ("Update", f"{self.dropped} progress messages skipped")
+        while self.pending:
+            key, message = next(iter(self.pending.items()))
+            try:
+                if force:
+                    self.messages.put(message)
+                else:
+                    self.messages.put_nowait(message)
+            except queue.Full:
+                # The GUI is behind, the rest waits for the next batch
+                return
+            del self.pending[key]
+            if key is None:
+                self.dropped = 0
+
+    def _write_waveform(self, x, y) -> None:
+        x, y = decimate_minmax(x, y, self.capacity)
+        with self.waveform_lock:
+            if self.memory is None:
+                return
+            self.x[:x.size] = x
+            self.y[:y.size] = y
+            self.header[1] = x.size
+            self.header[0] += 1
+
+    # Consumer side, called by the GUI
+
+    def poll(self) -> list:
+        """Every message that arrived since the last poll, the latest waveform (if it changed) first.
+
+        Never waits for the producer: while it is writing the waveform (or was paused or killed doing so) the waveform
+        is left for a later poll.
+        """
+        messages = []
+        if self.memory is None:
+            return messages
+        if self.waveform_lock.acquire(block=False):
+            try:
+                sequence, length = (int(value) for value in self.header)
+                if sequence != self.seen_sequence:
+                    self.seen_sequence = sequence
+                    messages.append(("UpdateYData", (self.x[:length].copy(), self.y[:length].copy())))
+            finally:
+                self.waveform_lock.release()
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self) -> None:
+        """Releases the shared buffer, and removes it in the process that created it.
+
+        An optimization still running in this process (e.g. a thread left running after the window closed) can keep
+        calling put(), which then does nothing. A producer process that was killed while holding the waveform lock
+        delays closing by at most a second.
+        """
+        locked = self.waveform_lock.acquire(timeout=1.0)
+        try:
+            if self.memory is None:
+                return
+            self.header = self.x = self.y = None
+            self.memory.close()
+            if self.owner:
+                self.memory.unlink()
+            self.memory = None
+        finally:
+            if locked:
+                self.waveform_lock.release()
@@ -0,0 +1,76 @@
+import time
+import numpy as np
+from backend.netlist_parse import Netlist
+from backend.simulator_backend import SimulatorBackend
+from backend.target_grid import TargetGrid
+from backend.constraint_engine import EqualityConstraintEngine
+
+"""
+Building blocks of a single residual evaluation, shared by curvefit_optimize and the worker processes that
+evaluate finite-difference points in parallel:
+1. apply_component_values writes a parameter vector into the Netlist and enforces the compiled equality part constraints
+2. simulate_component_values applies a parameter vector and runs it through a SimulatorBackend
+3. compute_residuals turns the simulated output columns into the residual vector on the target grid
+
+LiveWaveform is the chunk listener (see SimulatorBackend.stream_output) that shows a run's waveform on the live plot
+while it is still being simulated.
+"""
+
+# Shortest time between two live plot updates of a running simulation, in seconds
+LIVE_PLOT_INTERVAL = 0.25
+
+
+class LiveWaveform:
+    """Sends the target column of the running simulation to the live plot ("UpdateYData") as its chunks arrive."""
+
+    def __init__(self, queue, target_value: str, interval: float = LIVE_PLOT_INTERVAL):
+        self.queue = queue
+        self.target_value = target_value.upper()
+        self.interval = interval
+        self.start()
+
+    def start(self) -> None:
+        self.x_chunks = []
+        self.y_chunks = []
+        self.last_update = time.perf_counter()
+
+    def add(self, chunk: dict) -> None:
+        if self.target_value not in chunk:
+            return
+        self.x_chunks.append(chunk["TIME"])
+        self.y_chunks.append(chunk[self.target_value])
+        # Short runs finish before the first update is due, their complete waveform is plotted afterwards anyway
+        now = time.perf_counter()
+        if now - self.last_update >= self.interval:
+            self.last_update = now
+            self.queue.put(("UpdateYData",(np.concatenate(self.x_chunks),np.concatenate(self.y_chunks))))
+
+
+def apply_component_values(netlist: Netlist, component_names: list, component_values, constraint_engine: EqualityConstraintEngine) -> dict:
+    # Returns every value written as a component name -> value dict
+    table = netlist.components
+    table.set_values(component_names, component_values)
+    params = dict(zip(component_names, np.asarray(component_values, dtype=float).tolist()))
+
+    # ENFORCE EQUALITY PART CONSTRAINTS
+    params.update(constraint_engine.apply(table))
+    return params
+
+
+def simulate_component_values(backend: SimulatorBackend, netlist: Netlist, component_names: list, component_values, constraint_engine: EqualityConstraintEngine) -> dict:
+    params = apply_component_values(netlist, component_names, component_values, constraint_engine)
+    with backend.simulation_slot():
+        return backend.simulate(netlist, params)
+
+
+def compute_residuals(columns: dict, target_value: str, target_grid: TargetGrid, node_constraints: dict):
+    X_ARRAY_FROM_XYCE = columns["TIME"]
+    Y_ARRAY_FROM_XYCE = columns[target_value.upper()]
+
+    for node_name, (node_lower, node_upper) in node_constraints.items():
+        node_values = columns[node_name.upper()]
+        if (node_lower is not None and np.any(node_values < node_lower)) or (node_upper is not None and np.any(node_values > node_upper)):
+            return target_grid.penalty(), X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE  # TODO: Right now its just an arbitraritly large penalty
+
+    # TODO: Proper residual? (subrtarct, rms, etc.)
+    return target_grid.residuals(X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE), X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE
@@ -0,0 +1,121 @@
+import numpy as np
+from backend.netlist_parse import ComponentTable
+from backend.target_grid import TargetGrid
+from backend.constraint_engine import EqualityConstraintEngine
+
+"""
+Jacobian provider for least_squares built from the simulator's own transient sensitivities.
+
+With SimulatorBackend.enable_sensitivities() every simulation also returns d(target)/d(value) for the tunable
+components (Xyce's .SENS command), so the residual and its Jacobian come out of one run instead of the 2n extra
+runs of a finite-difference Jacobian. Since residual = ideal - simulated, each column is the negated sensitivity
+resampled onto the target grid. Components set by equality part constraints are sensitivity parameters too, and
+their effect is added through the chain rule, differentiating the (cheap) constraint expressions numerically.
+
+The finite-difference Jacobian stays as the fallback: for a point whose residual is the node constraint penalty,
+and for the rest of the run once a simulation comes back without sensitivities.
+"""
+
+EPS = np.finfo(np.float64).eps
+
+
+class SensitivityJacobian:
+    def __init__(self, evaluate, table: ComponentTable, component_names: list, target_grid: TargetGrid,
+                 constraint_engine: EqualityConstraintEngine, fallback, on_unavailable=None, transform=None):
+        """
+        Args:
+            evaluate: Callable taking a parameter vector and returning its (residual, columns), used when the
+                residual at x was not remembered.
+            table: ComponentTable of the netlist being optimized.
+            component_names: Names of the tunable components, in parameter vector order.
+            target_grid: TargetGrid the residuals are computed on.
+            constraint_engine: Equality constraints applied on top of the parameter vector.
+            fallback: Finite-difference Jacobian callable used when no sensitivities are available.
+            on_unavailable: Called once when sensitivities turn out to be unavailable, e.g. to stop requesting them.
+            transform: ParameterTransform the optimizer's coordinates go through (x are component values when None).
+        """
+        self.evaluate = evaluate
+        self.table = table
+        self.component_names = list(component_names)
+        self.positions = table.indices(self.component_names)
+        self.target_grid = target_grid
+        self.constraint_engine = constraint_engine
+        self.constrained = [(name, table.index[name]) for name in constraint_engine.constrained_names()]
+        self.fallback = fallback
+        self.on_unavailable = on_unavailable
+        self.transform = transform
+        self.available = True
+        self.last_x = None
+        self.last_f = None
+        self.last_columns = None
+        self.evaluations = 0
+        self.fallbacks = 0
+
+    def sensitivity_names(self) -> list:
+        """Components the simulator has to report sensitivities for."""
+        constrained = [name for name, _ in self.constrained]
+        return [name for name in self.component_names if name not in constrained] + constrained
+
+    def remember(self, x, f, columns=None) -> None:
+        """Records the residual and output columns at x so the Jacobian at the same x needs no new simulation."""
+        self.last_x = np.array(x, dtype=float)
+        self.last_f = np.asarray(f, dtype=float)
+        self.last_columns = columns
+        if hasattr(self.fallback, "remember"):
+            self.fallback.remember(x, f)
+
+    def _constraint_derivatives(self, x) -> np.ndarray:
+        # d(constrained value)/d(parameter) by central differences of the compiled constraint expressions
+        values = self.table.values.copy()
+        values[self.positions] = x
+        derivatives = np.zeros((len(self.constrained), x.size))
+        constrained_positions = [position for _, position in self.constrained]
+        for j, position in enumerate(self.positions):
+            h = EPS ** (1 / 3) * max(1.0, abs(x[j]))
+            upper = values.copy()
+            lower = values.copy()
+            upper[position] += h
+            lower[position] -= h
+            derivatives[:, j] = (self.constraint_engine.evaluate(self.table, upper)[constrained_positions] -
+                                 self.constraint_engine.evaluate(self.table, lower)[constrained_positions]) / (2 * h)
+        return derivatives
+
+    def __call__(self, x, *args):
+        x = np.asarray(x, dtype=float)
+        if not self.available:
+            return self.fallback(x, *args)
+        if self.last_x is not None and np.array_equal(self.last_x, x) and self.last_columns is not None:
+            f, columns = self.last_f, self.last_columns
+        else:
+            f, columns = self.evaluate(x)
+            self.evaluations += 1
+
+        if np.array_equal(f, self.target_grid.penalty()):
+            # The penalty is flat, only finite differences can see a way back into the feasible region. Checked first
+            # because a run aborted on a node constraint has no sensitivities either
+            self.fallbacks += 1
+            return self.fallback(x, *args)
+        names = [name.upper() for name in self.sensitivity_names()]
+        if "SENS:TIME" not in columns or any(f"SENS:{name}" not in columns for name in names):
+            self.available = False
+            if self.on_unavailable is not None:
+                self.on_unavailable()
+            self.fallbacks += 1
+            return self.fallback(x, *args)
+
+        # Sensitivities are per unit of component value, the chain rule takes them to the optimizer's coordinates
+        values = self.transform.to_values(x) if self.transform is not None else x
+        time_axis = columns["SENS:TIME"]
+        jacobian = np.zeros((self.target_grid.x.size, x.size))
+        constrained = {name for name, _ in self.constrained}
+        for j, name in enumerate(self.component_names):
+            if name not in constrained:
+                jacobian[:, j] = -self.target_grid.resample(time_axis, columns[f"SENS:{name.upper()}"])
+        if self.constrained:
+            derivatives = self._constraint_derivatives(values)
+            for k, (name, _) in enumerate(self.constrained):
+                sensitivity = -self.target_grid.resample(time_axis, columns[f"SENS:{name.upper()}"])
+                jacobian += np.outer(sensitivity, derivatives[k])
+        if self.transform is not None:
+            jacobian *= self.transform.derivative(x)
+        return jacobian
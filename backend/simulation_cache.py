@@ -0,0 +1,65 @@
+import hashlib
+from collections import OrderedDict
+
+"""
+Bounded LRU cache of simulation results, keyed on the parameter vector.
+
+least_squares regularly asks for the residual at a parameter vector it has already simulated (or one that only
+differs in the last few bits). Cache keys are the parameter values rounded to a fixed number of significant digits
+plus a fingerprint of the netlist file the run started from, which includes its .TRAN and .PRINT commands, so a
+cached waveform is only ever reused for the same circuit and analysis.
+"""
+
+
+def netlist_fingerprint(netlist_path: str) -> str:
+    with open(netlist_path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+class SimulationCache:
+    def __init__(self, fingerprint: str, max_entries: int = 128, significant_digits: int = 12):
+        """
+        Args:
+            fingerprint: Identifies the netlist and analysis, see netlist_fingerprint.
+            max_entries: Least recently used results are dropped beyond this many entries.
+            significant_digits: Parameter values that agree to this many significant digits share an entry. Must be
+                well above the digits finite-difference steps perturb (about 6 for a 3-point Jacobian).
+        """
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.significant_digits = significant_digits
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, component_values) -> tuple:
+        quantized = tuple(float(f"{float(value):.{self.significant_digits - 1}e}") for value in component_values)
+        return (self.fingerprint, quantized)
+
+    def get(self, component_values):
+        """Returns the cached result for component_values, or None on a miss."""
+        key = self.key(component_values)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, component_values, result) -> None:
+        key = self.key(component_values)
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def restore(self, entries) -> None:
+        """Adds the entries of another cache (e.g. one saved in a checkpoint) that were made for the same netlist."""
+        for key, result in entries.items():
+            if key[0] == self.fingerprint:
+                self.entries[key] = result
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats_message(self) -> str:
+        return f"simulation cache: {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,395 @@
+import os
+import abc
+import copy
+import contextlib
+import time
+import threading
+import subprocess
+import numpy as np
+from backend.netlist_parse import Netlist
+from backend.xyce_parsing_function import XyceError, PrnTail, read_prn_columns, read_raw_columns, read_sensitivity_columns
+from backend.standin_simulator import simulate_to_prn
+
+"""
+Simulator backends used by the optimizer.
+
+A backend owns one writable netlist file. simulate() writes the given component values into the Netlist, writes the
+netlist to that file, runs a transient simulation and returns the printed output as columns: a dict mapping the
+upper-case column name (e.g. 'TIME', 'V(2)') to a NumPy array. Only the columns listed in output_columns are
+loaded (all of them when it is None). Backends are picklable and with_netlist_path() gives an otherwise identical
+backend for another file, which is how worker processes get their own scratch copy.
+
+After enable_sensitivities() the netlist also gets a transient .SENS command and the returned columns additionally
+hold 'SENS:TIME' and one 'SENS:<component>' column per parameter with d(objective)/d(component value).
+
+After enable_early_abort() the output is checked against the node constraints while the simulation is still running
+and a run is stopped as soon as a constrained node leaves its bounds. simulate() then returns the columns up to that
+point, which contain the violation, so compute_residuals still turns them into the penalty. XyceBackend tails the .prn
+file as Xyce writes it and kills Xyce (prn output only, a rawfile is only readable once complete), StandInBackend
+checks between time steps. abort_stats counts the aborted runs and estimates the simulation time they saved.
+
+stream_output() hands the output to a listener in chunks while the simulation runs (e.g. to update the live plot).
+XyceBackend then reads the .prn incrementally as Xyce writes it, and the columns simulate() returns are put together
+from those chunks, so the parsing overlaps with the simulation instead of following it. The same streaming read
+serves the early abort check. Listeners are not pickled: worker processes never stream to the caller's UI.
+"""
+
+# Seconds between two looks at the .prn file of a running Xyce
+POLL_INTERVAL = 0.02
+
+
+class NodeBoundsWatch:
+    """Checks output columns (or the newest rows of them) against node constraints, see curvefit_optimize."""
+
+    def __init__(self, node_constraints: dict):
+        self.bounds = {name.upper(): (lower, upper) for name, (lower, upper) in node_constraints.items()
+                       if lower is not None or upper is not None}
+        self.violation = None
+
+    def reset(self) -> None:
+        self.violation = None
+
+    def __call__(self, columns: dict) -> bool:
+        """Returns True (and records the violation) if any constrained node in columns is out of bounds."""
+        for name, (lower, upper) in self.bounds.items():
+            values = columns.get(name)
+            if values is None or values.size == 0:
+                continue
+            if lower is not None and np.any(values < lower):
+                self.violation = f"{name} below {lower}"
+            elif upper is not None and np.any(values > upper):
+                self.violation = f"{name} above {upper}"
+            else:
+                continue
+            return True
+        return False
+
+
+class AbortStats:
+    """Counts complete and aborted simulations and their wall time."""
+
+    def __init__(self):
+        self.runs = 0
+        self.run_seconds = 0.0
+        self.aborts = 0
+        self.aborted_seconds = 0.0
+
+    def record(self, seconds: float, aborted: bool) -> None:
+        if aborted:
+            self.aborts += 1
+            self.aborted_seconds += seconds
+        else:
+            self.runs += 1
+            self.run_seconds += seconds
+
+    def add(self, other: "AbortStats") -> None:
+        self.runs += other.runs
+        self.run_seconds += other.run_seconds
+        self.aborts += other.aborts
+        self.aborted_seconds += other.aborted_seconds
+
+    def take(self) -> "AbortStats":
+        """Returns the counts so far and starts counting from zero again (how worker processes hand them over)."""
+        taken = copy.copy(self)
+        self.__init__()
+        return taken
+
+    def saved_seconds(self) -> float:
+        """Estimated time saved: the aborted runs at the average duration of a complete run, minus what they took."""
+        if self.runs == 0:
+            return 0.0
+        return max(0.0, self.aborts * self.run_seconds / self.runs - self.aborted_seconds)
+
+    def message(self) -> str:
+        return (f"early aborts: {self.aborts} of {self.aborts + self.runs} simulations stopped on a node constraint, "
+                f"estimated simulation time saved: {self.saved_seconds():.3f}s")
+
+
+class SimulatorBackend(abc.ABC):
+    """Base class for simulator backends, subclasses implement simulate()."""
+
+    name = "base"
+
+    def __init__(self, netlist_path: str, output_columns: list = None):
+        self.netlist_path = netlist_path
+        self.output_columns = output_columns
+        self.sensitivity = None
+        self.sensitivity_command = None
+        self.node_watch = None
+        self.abort_stats = AbortStats()
+        self.chunk_listener = None
+        # Shared simulator slots (see job_scheduler.py), None runs every simulation right away
+        self.slots = None
+        # Time spent writing the netlist and reading the output back after a run, see Workspace.io_report
+        self.io_seconds = 0.0
+        self.netlist_writes = 0
+
+    def __getstate__(self):
+        # Listeners usually hold the caller's queue or UI, they stay in this process
+        state = self.__dict__.copy()
+        state["chunk_listener"] = None
+        return state
+
+    def with_netlist_path(self, netlist_path: str) -> "SimulatorBackend":
+        backend = copy.copy(self)
+        backend.netlist_path = netlist_path
+        return backend
+
+    def sensitivity_path(self) -> str:
+        return self.netlist_path + ".SENS.prn"
+
+    def enable_sensitivities(self, objective: str, component_names: list) -> None:
+        """Asks for d(objective)/d(value) of each named R, L or C component on every run. None or [] turns it off."""
+        self.sensitivity = (objective, list(component_names)) if component_names else None
+
+    @property
+    def can_stream(self) -> bool:
+        """Whether the output can be read while the simulator writes it, which early abort and stream_output need."""
+        return True
+
+    def enable_early_abort(self, node_constraints: dict) -> bool:
+        """Stops runs as soon as a node leaves its node_constraints bounds. None or {} turns it off.
+
+        Returns whether runs are watched. A backend that cannot stream (see can_stream) never aborts a run, its node
+        constraints only apply once the run is complete.
+        """
+        watch = NodeBoundsWatch(node_constraints or {})
+        self.node_watch = watch if watch.bounds and self.can_stream else None
+        return self.node_watch is not None
+
+    @contextlib.contextmanager
+    def timed_io(self):
+        """Adds the time spent inside the with block to io_seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.io_seconds += time.perf_counter() - start
+
+    def simulation_slot(self):
+        """Context manager holding one of the shared simulator slots for the duration of a simulation."""
+        return self.slots if self.slots is not None else contextlib.nullcontext()
+
+    def stream_output(self, listener) -> None:
+        """Streams the output of every run to listener while it is simulated. None turns it off.
+
+        listener.start() is called when a run starts and listener.add(chunk) for every chunk of new output rows, a
+        dict of upper-case column name -> array with the 'TIME' column and every printed column.
+        """
+        self.chunk_listener = listener
+
+    def _streaming(self) -> bool:
+        return self.node_watch is not None or self.chunk_listener is not None
+
+    def _start_stream(self) -> None:
+        if self.node_watch is not None:
+            self.node_watch.reset()
+        if self.chunk_listener is not None:
+            self.chunk_listener.start()
+
+    def _take_chunk(self, chunk: dict) -> bool:
+        # Hands a chunk of output to the listener, returns True if the run has to be stopped
+        if not chunk:
+            return False
+        if self.chunk_listener is not None:
+            self.chunk_listener.add(chunk)
+        return self.node_watch is not None and self.node_watch(chunk)
+
+    def _set_sensitivity_command(self, netlist: Netlist) -> None:
+        # Add (or remove) the .SENS command and the option selecting direct sensitivities once per template
+        template = netlist.template_for(self.netlist_path)
+        if self.sensitivity_command is not None and self.sensitivity_command[0] is template and self.sensitivity_command[1] == self.sensitivity:
+            return
+        if self.sensitivity is None:
+            template.set_command(".SENS", None)
+            template.set_command(".OPTIONS SENSITIVITY", None)
+            self.sensitivity_command = None
+            return
+        else:
+            objective, component_names = self.sensitivity
+            parameters = ",".join(f"{name}:{name[0].upper()}" for name in component_names)
+            template.set_command(".SENS", f".SENS objfunc={{{objective}}} param={parameters}\n")
+            template.set_command(".OPTIONS SENSITIVITY", ".OPTIONS SENSITIVITY direct=1 adjoint=0\n")
+        self.sensitivity_command = (template, self.sensitivity)
+
+    def write_netlist(self, netlist: Netlist, params: dict) -> None:
+        netlist.components.set_values(list(params), list(params.values()))
+        netlist.file_path = self.netlist_path
+        if self.sensitivity is not None or self.sensitivity_command is not None:
+            self._set_sensitivity_command(netlist)
+        if self.sensitivity is not None:
+            # Never read back the previous run's sensitivities if this run fails to write them
+            try:
+                os.remove(self.sensitivity_path())
+            except FileNotFoundError:
+                pass
+        with self.timed_io():
+            netlist.class_to_file(self.netlist_path)
+        self.netlist_writes += 1
+
+    def add_sensitivities(self, columns: dict) -> dict:
+        """Adds the SENS: columns of the last run to columns. They are left out if the simulator did not write them."""
+        if self.sensitivity is None:
+            return columns
+        try:
+            with self.timed_io():
+                sensitivities = read_sensitivity_columns(self.sensitivity_path())
+        except XyceError as e:
+            print(f"No sensitivities: {e}")
+            return columns
+        for name, values in sensitivities.items():
+            columns[f"SENS:{name}"] = values
+        return columns
+
+    @abc.abstractmethod
+    def simulate(self, netlist: Netlist, params: dict) -> dict:
+        """Simulates netlist with params (component name -> value) applied and returns its output columns."""
+
+
+class XyceBackend(SimulatorBackend):
+    """Runs the Xyce executable and reads its output.
+
+    output_format="prn" (the default) has Xyce write a comma delimited .prn file that is parsed back as text.
+    output_format="raw" rewrites the netlist's .PRINT command to FORMAT=RAW so Xyce writes the printed values as a
+    binary rawfile instead, which is read through a memory map without parsing or copying. If the rawfile cannot be
+    read the backend falls back to the text path for the rest of the run.
+    """
+
+    name = "xyce"
+
+    def __init__(self, netlist_path: str, output_columns: list = None, xyce_command: str = "Xyce", output_format: str = "prn"):
+        super().__init__(netlist_path, output_columns)
+        self.xyce_command = xyce_command
+        self.output_format = output_format
+        self.print_template = None
+        self.print_format = None
+
+    @property
+    def can_stream(self) -> bool:
+        # A rawfile is only readable once complete
+        return self.output_format == "prn"
+
+    def raw_path(self) -> str:
+        return self.netlist_path + ".raw"
+
+    def _set_print_command(self, netlist: Netlist) -> None:
+        # Point the .PRINT command at the rawfile (or back at the .prn) once per template
+        template = netlist.template_for(self.netlist_path)
+        if self.print_template is template and self.print_format == self.output_format:
+            return
+        printed = []
+        for line in template.lines:
+            lineData = line.split()
+            if lineData and lineData[0].upper() == ".PRINT":
+                printed = [x for x in lineData[2:] if "=" not in x]
+                break
+        if self.output_format == "raw":
+            # Relative file name, Xyce runs in the netlist's directory
+            template.replace_command(".PRINT", f".PRINT TRAN FORMAT=RAW FILE={os.path.basename(self.raw_path())} {' '.join(printed)}\n")
+        else:
+            template.replace_command(".PRINT", f".PRINT TRAN {' '.join(printed)}\n")
+        self.print_template = template
+        self.print_format = self.output_format
+
+    def simulate(self, netlist: Netlist, params: dict) -> dict:
+        if self.output_format == "raw":
+            self._set_print_command(netlist)
+            # Arrays from the previous run may still map the old rawfile, so let Xyce create a new file rather than
+            # truncating the mapped one
+            try:
+                os.remove(self.raw_path())
+            except FileNotFoundError:
+                pass
+        self.write_netlist(netlist, params)
+        command = [self.xyce_command, "-delim", "COMMA", "-quiet", os.path.basename(self.netlist_path)]
+        cwd = os.path.dirname(os.path.abspath(self.netlist_path))
+        if self._streaming() and self.can_stream:
+            columns, aborted = self._run_streaming(command, cwd)
+            return columns if aborted else self.add_sensitivities(columns)
+        subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if self.output_format == "raw":
+            try:
+                # Windows cannot delete a mapped file, so copy the columns out there
+                with self.timed_io():
+                    columns = read_raw_columns(self.raw_path(), self.output_columns, copy=(os.name == "nt"))
+                return self.add_sensitivities(columns)
+            except XyceError as e:
+                print(f"Falling back to .prn output: {e}")
+                self.output_format = "prn"
+                self._set_print_command(netlist)
+                return self.simulate(netlist, params)
+        with self.timed_io():
+            columns = read_prn_columns(self.netlist_path + ".prn", self.output_columns)
+        return self.add_sensitivities(columns)
+
+    def _run_streaming(self, command: list, cwd: str):
+        # Runs Xyce while reading its .prn as it grows, returns the columns and whether Xyce had to be killed
+        prn_path = self.netlist_path + ".prn"
+        try:
+            os.remove(prn_path)
+        except FileNotFoundError:
+            pass
+        self._start_stream()
+        start = time.perf_counter()
+        # Nothing reads Xyce's console output, so it must not be able to fill a pipe and block
+        process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # A thread blocks on Xyce so the loop below wakes up the moment it exits instead of at the next poll
+        exited = threading.Event()
+        threading.Thread(target=lambda: (process.wait(), exited.set()), daemon=True).start()
+        tail = PrnTail(prn_path)
+        aborted = False
+        try:
+            running = True
+            while running:
+                running = not exited.wait(POLL_INTERVAL)
+                # After Xyce exits this reads the rest of the file
+                if self._take_chunk(tail.poll()) and running:
+                    process.kill()
+                    process.wait()
+                    aborted = True
+                    break
+            self.abort_stats.record(time.perf_counter() - start, aborted)
+            return tail.columns(self.output_columns), aborted
+        finally:
+            tail.close()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+class StandInBackend(SimulatorBackend):
+    """Runs the built-in linear transient solver (see standin_simulator.py) and reads back the .prn it writes."""
+
+    name = "standin"
+
+    def simulate(self, netlist: Netlist, params: dict) -> dict:
+        self.write_netlist(netlist, params)
+        if not self._streaming():
+            simulate_to_prn(self.netlist_path)
+            with self.timed_io():
+                columns = read_prn_columns(self.netlist_path + ".prn", self.output_columns)
+            return self.add_sensitivities(columns)
+        self._start_stream()
+        start = time.perf_counter()
+        simulate_to_prn(self.netlist_path, stop=self._take_chunk)
+        aborted = self.node_watch is not None and self.node_watch.violation is not None
+        self.abort_stats.record(time.perf_counter() - start, aborted)
+        with self.timed_io():
+            columns = read_prn_columns(self.netlist_path + ".prn", self.output_columns)
+        return self.add_sensitivities(columns)
+
+
+BACKENDS = {
+    XyceBackend.name: XyceBackend,
+    StandInBackend.name: StandInBackend,
+}
+
+
+def make_backend(simulator: str, netlist_path: str) -> SimulatorBackend:
+    """Creates the backend registered under simulator ('xyce', 'xyce-raw' or 'standin') for netlist_path."""
+    if simulator.lower() == "xyce-raw":
+        return XyceBackend(netlist_path, output_format="raw")
+    try:
+        return BACKENDS[simulator.lower()](netlist_path)
+    except KeyError:
+        raise ValueError(f"Unknown simulator '{simulator}', expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,370 @@
+import re
+import numpy as np
+from typing import Optional
+from scipy.linalg import lu_factor, lu_solve
+from backend.xyce_parsing_function import NetlistError
+
+"""
+Deterministic stand-in for Xyce, used to test and benchmark the optimizer on machines without Xyce installed.
+
+It runs a fixed-step backward Euler transient of linear circuits built from R, L, C, independent V/I sources
+(DC, SIN and PULSE) and linear controlled sources (E, G), using modified nodal analysis. The .TRAN and
+.PRINT TRAN commands of the netlist are honoured and the result is written in the same comma delimited .prn format
+that "Xyce -delim COMMA" produces, so the rest of the pipeline cannot tell the difference. A .SENS command adds
+direct sensitivities of one printed value to R, L and C values, written to a .SENS.prn file as Xyce does. Anything
+else (subcircuits, semiconductors, behavioural sources) raises NetlistError.
+"""
+
+# Number of times a run is handed to a stop callback, see StandInCircuit.simulate
+STOP_CHECKS = 50
+
+_SCALE_FACTORS = {
+    "T": 1e12,
+    "G": 1e9,
+    "MEG": 1e6,
+    "K": 1e3,
+    "M": 1e-3,
+    "MIL": 25.4e-6,
+    "U": 1e-6,
+    "µ": 1e-6,
+    "N": 1e-9,
+    "P": 1e-12,
+    "F": 1e-15,
+}
+
+_VALUE_PATTERN = re.compile(r"^([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)(MEG|MIL|[TGKMUµNPF])?", re.IGNORECASE)
+
+GROUND_NODES = ("0", "GND")
+GMIN = 1e-12
+
+
+def parse_spice_value(text: str) -> float:
+    """Converts a SPICE number such as '4.7k', '10MEG', '1e-9' or '5V' to a float."""
+    match = _VALUE_PATTERN.match(text.strip())
+    if not match:
+        raise NetlistError(f"Could not parse value '{text}'")
+    value = float(match.group(1))
+    if match.group(2):
+        value *= _SCALE_FACTORS[match.group(2).upper()]
+    return value
+
+
+def _source_function(tokens: list):
+    # Returns f(t) for an independent source given the tokens after its two nodes
+    text = " ".join(tokens).upper().replace("(", " ( ").replace(")", " ) ").replace(",", " ")
+    words = text.split()
+    dc_value = 0.0
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in ("SIN", "PULSE"):
+            j = i + 1
+            if j < len(words) and words[j] == "(":
+                j += 1
+            args = []
+            while j < len(words) and words[j] != ")":
+                args.append(parse_spice_value(words[j]))
+                j += 1
+            if word == "SIN":
+                vo, va, freq, td, theta, phase = (args + [0.0] * 6)[:6]
+
+                def sine(t, vo=vo, va=va, freq=freq, td=td, theta=theta, phase=phase):
+                    if t < td:
+                        return vo + va * np.sin(np.pi * phase / 180)
+                    return vo + va * np.exp(-(t - td) * theta) * np.sin(2 * np.pi * freq * (t - td) + np.pi * phase / 180)
+                return sine
+            v1, v2, td, tr, tf, pw, per = (args + [0.0] * 7)[:7]
+
+            def pulse(t, v1=v1, v2=v2, td=td, tr=tr, tf=tf, pw=pw, per=per):
+                if t < td:
+                    return v1
+                local = (t - td) % per if per > 0 else t - td
+                if local < tr:
+                    return v1 + (v2 - v1) * local / tr
+                if local < tr + pw:
+                    return v2
+                if local < tr + pw + tf:
+                    return v2 + (v1 - v2) * (local - tr - pw) / tf
+                return v1
+            return pulse
+        if word == "DC" and i + 1 < len(words):
+            dc_value = parse_spice_value(words[i + 1])
+            i += 2
+            continue
+        if word in ("AC", "ACPHASE"):
+            i += 2
+            continue
+        try:
+            dc_value = parse_spice_value(word)
+        except NetlistError:
+            pass
+        i += 1
+    return lambda t, value=dc_value: value
+
+
+def _read_statements(netlist_path: str) -> list:
+    # Netlist lines as token lists, with the title line, comments and blank lines removed and + continuations joined
+    statements = []
+    with open(netlist_path, "r") as file:
+        lines = file.readlines()[1:]
+    for line in lines:
+        line = line.split(";")[0].strip()
+        if not line or line.startswith("*"):
+            continue
+        if line.startswith("+") and statements:
+            statements[-1].extend(line[1:].split())
+            continue
+        statements.append(line.split())
+    return statements
+
+
+class StandInCircuit:
+    def __init__(self, netlist_path: str):
+        self.elements = []
+        self.print_columns = []
+        self.tran = None
+        self.aborted = False
+        self.sensitivity = None
+        self.sensitivity_columns = {}
+        self.nodes = {}
+        self.branches = {}
+
+        for tokens in _read_statements(netlist_path):
+            keyword = tokens[0].upper()
+            if keyword == ".END":
+                break
+            if keyword == ".TRAN":
+                self.tran = [parse_spice_value(x) for x in tokens[1:5]]
+                continue
+            if keyword == ".SENS":
+                # .SENS objfunc={V(2)} param=R1:R,R2:R
+                text = " ".join(tokens[1:]).upper()
+                objective = re.search(r"OBJFUNC\s*=\s*\{?\s*([^}\s]+)\s*\}?", text)
+                parameters = re.search(r"PARAM\s*=\s*(\S+)", text)
+                if not objective or not parameters:
+                    raise NetlistError(f"Could not parse {' '.join(tokens)}")
+                self.sensitivity = (objective.group(1), [x.split(":")[0] for x in parameters.group(1).split(",") if x])
+                continue
+            if keyword == ".PRINT":
+                self.print_columns.extend(x.upper() for x in tokens[2:] if "(" in x)
+                continue
+            if keyword in (".SUBCKT", ".INCLUDE", ".INC", ".LIB"):
+                raise NetlistError(f"Stand-in simulator does not support {tokens[0]}")
+            if keyword.startswith("."):
+                continue
+            kind = keyword[0]
+            if kind not in "RLCVIEG":
+                raise NetlistError(f"Stand-in simulator does not support element {tokens[0]}")
+            nodes = [x.upper() for x in tokens[1:5 if kind in "EG" else 3]]
+            for node in nodes:
+                if node not in GROUND_NODES and node not in self.nodes:
+                    self.nodes[node] = len(self.nodes)
+            if kind in "RLCEG":
+                value = parse_spice_value(tokens[5] if kind in "EG" else tokens[3])
+            else:
+                value = _source_function(tokens[3:])
+            self.elements.append((kind, keyword, nodes, value))
+
+        if self.tran is None:
+            raise NetlistError("Stand-in simulator needs a .TRAN command")
+        if not self.print_columns:
+            raise NetlistError("Stand-in simulator needs a .PRINT TRAN command")
+        # Voltage sources, VCVSs and inductors get a branch current unknown after the node voltages
+        for kind, name, _, _ in self.elements:
+            if kind in "VLE":
+                self.branches[name] = len(self.nodes) + len(self.branches)
+        self.size = len(self.nodes) + len(self.branches)
+        if self.sensitivity is not None:
+            for parameter in self.sensitivity[1]:
+                if not any(name == parameter and kind in "RLC" for kind, name, _, _ in self.elements):
+                    raise NetlistError(f"Stand-in simulator can only compute sensitivities to R, L and C values, not {parameter}")
+
+    def _index(self, node: str):
+        return None if node in GROUND_NODES else self.nodes[node]
+
+    def _stamp_conductance(self, matrix, a, b, g):
+        if a is not None:
+            matrix[a, a] += g
+        if b is not None:
+            matrix[b, b] += g
+        if a is not None and b is not None:
+            matrix[a, b] -= g
+            matrix[b, a] -= g
+
+    def _stamp_branch(self, matrix, k, a, b):
+        if a is not None:
+            matrix[a, k] += 1.0
+            matrix[k, a] += 1.0
+        if b is not None:
+            matrix[b, k] -= 1.0
+            matrix[k, b] -= 1.0
+
+    def _matrices(self, step, derivative_of=None):
+        # Backward Euler as A x_n = B x_(n-1) + u(t_n). step=None builds the DC operating point system (capacitors
+        # open, inductors shorted, B unused). derivative_of=element name gives dA/dp and dB/dp for that element's value
+        A = np.zeros((self.size, self.size))
+        B = np.zeros((self.size, self.size))
+        if derivative_of is None:
+            for i in range(len(self.nodes)):
+                A[i, i] += GMIN
+        for kind, name, nodes, value in self.elements:
+            if derivative_of is not None and name != derivative_of:
+                continue
+            a, b = self._index(nodes[0]), self._index(nodes[1])
+            match kind:
+                case "R":
+                    g = -1.0 / value ** 2 if derivative_of else 1.0 / value
+                    self._stamp_conductance(A, a, b, g)
+                case "C":
+                    if step is not None:
+                        g = (1.0 if derivative_of else value) / step
+                        self._stamp_conductance(A, a, b, g)
+                        self._stamp_conductance(B, a, b, g)
+                case "L":
+                    k = self.branches[name]
+                    if derivative_of is None:
+                        self._stamp_branch(A, k, a, b)
+                    if step is not None:
+                        r = (1.0 if derivative_of else value) / step
+                        A[k, k] -= r
+                        B[k, k] -= r
+                case "V":
+                    self._stamp_branch(A, self.branches[name], a, b)
+                case "E":
+                    k = self.branches[name]
+                    self._stamp_branch(A, k, a, b)
+                    c, d = self._index(nodes[2]), self._index(nodes[3])
+                    if c is not None:
+                        A[k, c] -= value
+                    if d is not None:
+                        A[k, d] += value
+                case "G":
+                    c, d = self._index(nodes[2]), self._index(nodes[3])
+                    for row, sign in ((a, 1.0), (b, -1.0)):
+                        if row is None:
+                            continue
+                        if c is not None:
+                            A[row, c] += sign * value
+                        if d is not None:
+                            A[row, d] -= sign * value
+        return A, B
+
+    def _sources(self, t):
+        u = np.zeros(self.size)
+        for kind, name, nodes, value in self.elements:
+            a, b = self._index(nodes[0]), self._index(nodes[1])
+            match kind:
+                case "V":
+                    u[self.branches[name]] = value(t)
+                case "I":
+                    current = value(t)
+                    if a is not None:
+                        u[a] -= current
+                    if b is not None:
+                        u[b] += current
+        return u
+
+    def _column(self, name: str, solution):
+        match = re.fullmatch(r"([VI])\((.+)\)", name)
+        if not match:
+            raise NetlistError(f"Stand-in simulator cannot print {name}")
+        kind, argument = match.groups()
+        if kind == "I":
+            if argument not in self.branches:
+                raise NetlistError(f"Stand-in simulator can only print currents of V, E and L elements, not {name}")
+            return solution[:, self.branches[argument]]
+        voltages = []
+        for node in argument.split(","):
+            node = node.strip()
+            index = self._index(node)
+            voltages.append(np.zeros(solution.shape[0]) if index is None else solution[:, index])
+        return voltages[0] - voltages[1] if len(voltages) == 2 else voltages[0]
+
+    def simulate(self, stop=None):
+        """Returns the output times and a dict of .PRINT column name -> values.
+
+        stop, when given, is called with the columns (TIME included) of every new stretch of output as it is computed,
+        and ends the run early (without sensitivities) when it returns True, like a simulator that was killed.
+        self.aborted tells whether it did.
+        """
+        initial_step, final_time = self.tran[0], self.tran[1]
+        start_time = self.tran[2] if len(self.tran) > 2 else 0.0
+        step_ceiling = self.tran[3] if len(self.tran) > 3 else 0.0
+        # Fixed step: the step ceiling when there is one, otherwise the initial step (at most 1/200th of the run)
+        if step_ceiling > 0:
+            step = step_ceiling
+        else:
+            step = min(x for x in (initial_step, final_time / 200) if x > 0)
+        steps = int(np.ceil(final_time / step - 1e-9))
+        times = np.linspace(0.0, final_time, steps + 1)
+        step = times[1] - times[0]
+
+        solution = np.empty((times.size, self.size))
+        dc_matrix = self._matrices(None)[0]
+        solution[0] = np.linalg.solve(dc_matrix, self._sources(0.0))
+        A, B = self._matrices(step)
+        factorization = lu_factor(A)
+        self.aborted = False
+        # Output is handed to stop in about STOP_CHECKS stretches, as a simulator writes it out
+        check_every = max(1, times.size // STOP_CHECKS)
+        checked = 0
+        for n in range(1, times.size):
+            solution[n] = lu_solve(factorization, B @ solution[n - 1] + self._sources(times[n]))
+            if stop is not None and (n % check_every == 0 or n == times.size - 1):
+                stretch = slice(max(checked, np.searchsorted(times, start_time - 1e-15)), n + 1)
+                checked = n + 1
+                # stop sees the values as they are written to the .prn, so it agrees with whoever reads it back
+                if stretch.start < stretch.stop:
+                    chunk = {name: _as_printed(self._column(name, solution[stretch])) for name in self.print_columns}
+                    chunk["TIME"] = _as_printed(times[stretch])
+                    if stop(chunk):
+                        self.aborted = True
+                        times, solution = times[:n + 1], solution[:n + 1]
+                        break
+
+        keep = times >= start_time - 1e-15
+        columns = {name: self._column(name, solution)[keep] for name in self.print_columns}
+        self.sensitivity_columns = {}
+        if self.sensitivity is not None and not self.aborted:
+            objective, parameters = self.sensitivity
+            # Direct sensitivities: differentiating A x_n = B x_(n-1) + u gives A s_n = dB x_(n-1) + B s_(n-1) - dA x_n,
+            # which reuses the transient's factorization
+            for parameter in parameters:
+                dc_derivative = self._matrices(None, parameter)[0]
+                dA, dB = self._matrices(step, parameter)
+                sensitivity = np.empty_like(solution)
+                sensitivity[0] = np.linalg.solve(dc_matrix, -dc_derivative @ solution[0])
+                for n in range(1, times.size):
+                    sensitivity[n] = lu_solve(factorization, dB @ solution[n - 1] + B @ sensitivity[n - 1] - dA @ solution[n])
+                self.sensitivity_columns[f"d{{{objective}}}/d({parameter}:{parameter[0]})_Dir"] = self._column(objective, sensitivity)[keep]
+        return times[keep], columns
+
+def _as_printed(values) -> np.ndarray:
+    return np.array([float(f"{value:.8e}") for value in values])
+
+
+def _write_prn(path: str, times, columns: dict, footer: Optional[str]) -> None:
+    names = list(columns)
+    data = np.column_stack([np.arange(times.size), times] + [columns[name] for name in names])
+    with open(path, "w") as file:
+        file.write(",".join(["Index", "TIME"] + names) + "\n")
+        for row in data:
+            file.write(f"{int(row[0])}," + ",".join(f"{value:.8e}" for value in row[1:]) + "\n")
+        if footer:
+            file.write(footer + "\n")
+
+
+def simulate_to_prn(netlist_path: str, prn_path: str = None, stop=None) -> str:
+    """Simulates netlist_path and writes its output to prn_path (netlist_path + '.prn' by default).
+
+    A .SENS command also writes the direct transient sensitivities to netlist_path + '.SENS.prn', like Xyce does.
+    A run ended early by stop (see StandInCircuit.simulate) leaves a .prn without footer and no sensitivities, like
+    a killed Xyce.
+    """
+    prn_path = prn_path or netlist_path + ".prn"
+    circuit = StandInCircuit(netlist_path)
+    times, columns = circuit.simulate(stop)
+    _write_prn(prn_path, times, columns, None if circuit.aborted else "End of Xyce(TM) Simulation")
+    if circuit.sensitivity is not None and not circuit.aborted:
+        _write_prn(netlist_path + ".SENS.prn", times, circuit.sensitivity_columns, "End of Xyce(TM) Sensitivity Simulation")
+    return prn_path
@@ -0,0 +1,170 @@
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.optimize import least_squares
+from backend.netlist_parse import Netlist
+from backend.residual_evaluation import apply_component_values, simulate_component_values, compute_residuals, LiveWaveform
+from backend.simulator_backend import SimulatorBackend, XyceBackend
+from backend.target_grid import TargetGrid
+from backend.constraint_engine import EqualityConstraintEngine
+from backend.parameter_transform import LogTransform
+
+"""
+Surrogate-assisted trust-region optimizer, an alternative engine to curvefit_optimize for circuits where a single
+simulation is expensive (e.g. switching converters).
+
+Every simulated point is kept, and a radial basis function interpolant (thin plate spline with a linear tail) of the
+whole residual vector is fitted through the ones nearest the current best point. Each iteration minimizes the surrogate's least squares cost inside a
+trust region around the best point so far and only simulates that one candidate. The trust region grows when the
+surrogate predicted the improvement well and shrinks when it did not, and the new point is added to the surrogate
+before the next iteration. Parameters are searched in log space (relative to their starting values, see
+LogTransform), so resistors and capacitors move on the same scale.
+
+Progress goes through the same queue messages as curvefit_optimize ("Update" and "UpdateYData") and the return value
+has the same layout: [simulations, iterations, initial cost, final cost, optimality].
+"""
+
+INITIAL_RADIUS = 0.5
+MAX_RADIUS = 4.0
+MIN_RADIUS = 1e-6
+
+
+def surrogate_optimize(target_value: str, target_curve_rows: list, netlist: Netlist, writable_netlist_path: str, node_constraints: dict, equality_part_constraints: list, queue, custom_xtol= 1e-12, custom_gtol= 1e-12, custom_ftol= 1e-12, max_simulations= 100, backend: SimulatorBackend = None, seed= 0, live_plot= False) -> list:
+    """Fits the target curve like curvefit_optimize, spending at most max_simulations simulations.
+
+    Stops when the trust region radius drops below max(custom_xtol, 1e-6) (in log space), when an accepted step lowers
+    the cost by less than custom_ftol times the cost, when the surrogate's gradient (infinity norm) drops below
+    custom_gtol, or when the simulation budget is used up.
+    """
+    target_grid = TargetGrid(target_curve_rows)
+    if backend is None:
+        backend = XyceBackend(writable_netlist_path)
+    backend.output_columns = ["TIME", target_value] + list(node_constraints)
+    backend.enable_early_abort(node_constraints)
+    # Only the GUI has a live plot to stream to
+    backend.stream_output(LiveWaveform(queue, target_value) if live_plot else None)
+
+    table = netlist.components
+    changing_indices = np.flatnonzero(table.variable_mask)
+    changing_components_names = [table[i].name for i in changing_indices]
+    space = LogTransform(table.values[changing_indices], table.min_vals[changing_indices], table.max_vals[changing_indices])
+    search_lower, search_upper = space.search_bounds()
+    constraint_engine = EqualityConstraintEngine(table, equality_part_constraints)
+    rng = np.random.default_rng(seed)
+    n = len(changing_indices)
+
+    points = []
+    residual_rows = []
+    feasible = []
+    simulations = 0
+
+    def simulate(u):
+        nonlocal simulations
+        simulations += 1
+        columns = simulate_component_values(backend, netlist, changing_components_names, space.to_values(u), constraint_engine)
+        residual, X_ARRAY_FROM_XYCE, Y_ARRAY_FROM_XYCE = compute_residuals(columns, target_value, target_grid, node_constraints)
+        queue.put(("UpdateYData",(X_ARRAY_FROM_XYCE,Y_ARRAY_FROM_XYCE)))
+        queue.put(("UpdateCost",[cost(residual)]))
+        if simulations % 5 == 0:
+            queue.put(("Update",f"total runs completed: {simulations}"))
+        # Node constraint penalties are flat and huge, they would wreck the interpolant so they are left out of it
+        is_feasible = not np.array_equal(residual, target_grid.penalty())
+        points.append(np.array(u, dtype=float))
+        residual_rows.append(residual)
+        feasible.append(is_feasible)
+        return residual
+
+    def cost(residual):
+        return 0.5 * float(np.dot(residual, residual))
+
+    def is_new(u):
+        return all(np.max(np.abs(u - point)) > 1e-12 for point in points)
+
+    # The netlist's values, 0 for log-mapped parameters but the value itself for the ones LogTransform keeps linear
+    center = np.clip(space.to_search(table.values[changing_indices]), search_lower, search_upper)
+    center_cost = cost(simulate(center))
+    initial_cost = center_cost
+    radius = INITIAL_RADIUS
+    min_radius = max(custom_xtol, MIN_RADIUS)
+
+    # Initial design: one step along every coordinate (away from the nearer bound), enough for the linear tail
+    for j in range(n):
+        if simulations >= max_simulations:
+            break
+        step = np.zeros(n)
+        step[j] = radius if center[j] + radius <= search_upper[j] else -radius
+        point = np.clip(center + step, search_lower, search_upper)
+        if is_new(point):
+            simulate(point)
+    best = int(np.argmin([cost(residual) for residual in residual_rows]))
+    center, center_cost = points[best], cost(residual_rows[best])
+
+    iterations = 0
+    optimality = np.inf
+    while simulations < max_simulations and center_cost > 0:
+        iterations += 1
+        # Fit through the points nearest the center only, enough for a quadratic, so the model stays local
+        nearest = sorted((np.max(np.abs(point - center)), i) for i, (point, ok) in enumerate(zip(points, feasible)) if ok)
+        nearest = [i for _, i in nearest[:(n + 1) * (n + 2) // 2 + n]]
+        fit_points = np.array([points[i] for i in nearest])
+        fit_rows = np.array([residual_rows[i] for i in nearest])
+        lower = np.maximum(search_lower, center - radius)
+        upper = np.minimum(search_upper, center + radius)
+
+        try:
+            surrogate = RBFInterpolator(fit_points, fit_rows, kernel="thin_plate_spline", degree=1) if len(fit_points) >= n + 1 else None
+        except np.linalg.LinAlgError:
+            # Points too close together or all in a lower dimensional subspace
+            surrogate = None
+        if surrogate is not None:
+            model = lambda u: surrogate(u[None, :])[0]
+            # Open the box a hair so least_squares accepts a center sitting on a bound
+            search = least_squares(model, np.clip(center, lower, upper), bounds=(lower - 1e-15, upper + 1e-15), method="trf")
+            candidate = np.clip(search.x, lower, upper)
+            predicted = center_cost - cost(model(candidate))
+            optimality = np.linalg.norm(search.grad, ord=np.inf) if np.allclose(search.x, center) else optimality
+        else:
+            candidate, predicted = None, 0.0
+
+        if candidate is None or predicted <= 0 or not is_new(candidate):
+            # The surrogate sees no way down here, sample a random point in the trust region to improve it
+            if candidate is not None and predicted <= 0 and np.allclose(candidate, center) and optimality < custom_gtol:
+                break
+            candidate = np.clip(center + radius * rng.uniform(-1.0, 1.0, n), search_lower, search_upper)
+            radius *= 0.5
+            if radius < min_radius:
+                break
+            if is_new(candidate):
+                residual = simulate(candidate)
+                if cost(residual) < center_cost:
+                    center, center_cost = candidate, cost(residual)
+            continue
+
+        residual = simulate(candidate)
+        actual = center_cost - cost(residual)
+        ratio = actual / predicted
+        step_length = np.max(np.abs(candidate - center))
+        if ratio < 0.25:
+            radius = 0.5 * min(radius, step_length) if step_length > 0 else 0.5 * radius
+        elif ratio > 0.75 and step_length >= 0.9 * radius:
+            radius = min(2 * radius, MAX_RADIUS)
+        else:
+            radius = max(step_length, 0.5 * radius)
+        if actual > 0:
+            converged = actual < custom_ftol * center_cost
+            center, center_cost = candidate, cost(residual)
+            if converged:
+                break
+        queue.put(("Update",f"surrogate iteration {iterations}: cost {center_cost:.5g}, trust radius {radius:.3g}, {simulations} simulations"))
+        if radius < min_radius:
+            break
+
+    if backend.node_watch is not None:
+        queue.put(("Update",backend.abort_stats.message()))
+
+    # Leave the netlist at the best point found, equality constraints included
+    best_values = space.to_values(center)
+    netlist.file_path = writable_netlist_path
+    apply_component_values(netlist, changing_components_names, best_values, constraint_engine)
+    netlist.class_to_file(writable_netlist_path)
+    optimality = 0.0 if center_cost == 0 else optimality
+    return [simulations, iterations, float(f"{initial_cost:.5g}"), float(f"{center_cost:.5g}"), float(f"{optimality:.3g}")]
@@ -0,0 +1,73 @@
+import numpy as np
+
+"""
+Fixed evaluation grid for the residuals.
+
+The grid is the sorted, de-duplicated x values of the target curve, so it is known before the first simulation and
+never changes during a run, and the target is sampled onto it exactly once. Simulated waveforms are resampled onto
+the grid by linear interpolation. The interpolation indices and weights only depend on the simulator's time axis,
+so they are kept in preallocated buffers and only recomputed when the time axis changes (fixed-step runs reuse
+them every time).
+"""
+
+
+class TargetGrid:
+    def __init__(self, target_curve_rows: list):
+        """
+        Args:
+            target_curve_rows: Target curve as [x, y] rows, as passed to curvefit_optimize.
+        """
+        rows = np.asarray(target_curve_rows, dtype=float)
+        x, first = np.unique(rows[:, 0], return_index=True)
+        self.x = x
+        self.ideal = rows[first, 1]
+        self.start = x[0]
+        self.end = x[-1]
+
+        # Resampling buffers, filled by _plan for a given simulator time axis
+        self._time_axis = None
+        self._lower = np.empty(x.size, dtype=np.intp)
+        self._upper = np.empty(x.size, dtype=np.intp)
+        self._weight = np.empty(x.size)
+        self._lower_values = np.empty(x.size)
+        self._upper_values = np.empty(x.size)
+        self._simulated = np.empty(x.size)
+
+    def __getstate__(self):
+        # Time axes are per process, don't ship the cached plan to workers
+        state = self.__dict__.copy()
+        state["_time_axis"] = None
+        return state
+
+    def _plan(self, time_axis) -> None:
+        if self._time_axis is not None and self._time_axis.size == time_axis.size and np.array_equal(self._time_axis, time_axis):
+            return
+        upper = np.clip(np.searchsorted(time_axis, self.x, side="right"), 1, time_axis.size - 1)
+        self._upper[:] = upper
+        np.subtract(self._upper, 1, out=self._lower)
+        t0 = time_axis[self._lower]
+        span = time_axis[self._upper] - t0
+        span[span == 0] = 1.0
+        np.clip((self.x - t0) / span, 0.0, 1.0, out=self._weight)
+        self._time_axis = np.array(time_axis)
+
+    def resample(self, time_axis, values) -> np.ndarray:
+        """Linearly interpolates values (sampled at time_axis) onto the grid. The result is an internal buffer."""
+        if time_axis.size == 1:
+            self._simulated.fill(values[0])
+            return self._simulated
+        self._plan(time_axis)
+        np.take(values, self._lower, out=self._lower_values)
+        np.take(values, self._upper, out=self._upper_values)
+        # lower + weight * (upper - lower)
+        np.subtract(self._upper_values, self._lower_values, out=self._simulated)
+        np.multiply(self._simulated, self._weight, out=self._simulated)
+        np.add(self._simulated, self._lower_values, out=self._simulated)
+        return self._simulated
+
+    def residuals(self, time_axis, values) -> np.ndarray:
+        """Target minus the simulated waveform on the grid, as a new array least_squares can keep."""
+        return np.subtract(self.ideal, self.resample(time_axis, values))
+
+    def penalty(self, value: float = 1e6) -> np.ndarray:
+        return np.full(self.x.size, value)
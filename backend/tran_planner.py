@@ -0,0 +1,110 @@
+import numpy as np
+
+"""
+Plans the .TRAN command of the optimization netlist from the target curve.
+
+The simulated waveform only has to resolve what the target curve can show, so the plan is derived from two properties
+of the target:
+
+- its sampling density: the median spacing of its x values, which sets the print interval (there is no point in
+  printing much finer than the curve it is compared against)
+- its bandwidth: the frequency below which a given fraction of the spectral energy of the (detrended) target lies,
+  resolved with a number of time steps per period, which sets the step ceiling
+
+The step ceiling is kept between a lower limit relative to the sample spacing (so measurement noise in the target does
+not force a tiny step) and an upper limit relative to the run length. Output starts one print interval before the
+target's first point, so the first grid point is interpolated between two simulated points.
+
+Presets trade speed for fidelity, "balanced" being the default:
+
+- "fast": coarse steps, for quick exploration or slow simulations
+- "balanced": steps down to a quarter of the target's sample spacing
+- "accurate": fine steps and printing at twice the target's density, for the final fit of fast waveforms
+"""
+
+TRAN_PRESETS = {
+    # energy: fraction of the target's spectral energy the bandwidth must contain
+    # steps_per_period: time steps per period of the bandwidth frequency
+    # min_step_factor: smallest step ceiling, in target sample spacings
+    # print_factor: print interval, in target sample spacings
+    # min_steps: the step ceiling is at most the run length / min_steps
+    "fast": {"energy": 0.95, "steps_per_period": 8, "min_step_factor": 1.0, "print_factor": 1.0, "min_steps": 50},
+    "balanced": {"energy": 0.99, "steps_per_period": 20, "min_step_factor": 0.25, "print_factor": 1.0, "min_steps": 100},
+    "accurate": {"energy": 0.999, "steps_per_period": 50, "min_step_factor": 0.1, "print_factor": 0.5, "min_steps": 200},
+}
+
+# Largest number of points the target is resampled to for the bandwidth estimate
+MAX_SPECTRUM_POINTS = 1 << 16
+
+
+class TranPlan:
+    """The .TRAN settings for a target curve, all in seconds."""
+
+    def __init__(self, initial_step, final_time, start_time, step_ceiling, print_interval, bandwidth, preset):
+        self.initial_step = initial_step
+        self.final_time = final_time
+        self.start_time = start_time
+        self.step_ceiling = step_ceiling
+        self.print_interval = print_interval
+        # Estimated bandwidth of the target in Hz, 0 for a flat target
+        self.bandwidth = bandwidth
+        self.preset = preset
+
+    def __str__(self):
+        return (f"{self.preset} .TRAN plan: step ceiling {self.step_ceiling:.4g}s, print interval {self.print_interval:.4g}s, "
+                f"start {self.start_time:.4g}s, end {self.final_time:.4g}s (target bandwidth {self.bandwidth:.4g}Hz)")
+
+
+def _round(value: float) -> float:
+    # Four significant digits keep the netlist readable
+    return float(f"{value:.4g}")
+
+
+def target_bandwidth(x, y, energy: float) -> float:
+    """Frequency (Hz) below which the energy fraction of the target's spectrum lies, 0 for a flat target.
+
+    The target is resampled onto a uniform grid at its smallest sample spacing and the straight line through its end
+    points is removed first, so a waveform that ends at a different level than it starts does not look like a step.
+    """
+    span = x[-1] - x[0]
+    if x.size < 3 or span <= 0:
+        return 0.0
+    points = int(min(MAX_SPECTRUM_POINTS, max(x.size, np.ceil(span / np.min(np.diff(x))) + 1)))
+    uniform_x = np.linspace(x[0], x[-1], points)
+    uniform_y = np.interp(uniform_x, x, y)
+    uniform_y -= uniform_y[0] + (uniform_y[-1] - uniform_y[0]) * (uniform_x - x[0]) / span
+    power = np.abs(np.fft.rfft(uniform_y))[1:] ** 2
+    total = power.sum()
+    if total <= 0:
+        return 0.0
+    frequencies = np.fft.rfftfreq(points, span / (points - 1))[1:]
+    return float(frequencies[np.searchsorted(np.cumsum(power), energy * total)])
+
+
+def plan_transient(target_curve_rows: list, preset: str = "balanced") -> TranPlan:
+    """Plans the .TRAN command for a target curve given as [x, y] rows.
+
+    Raises:
+        ValueError: preset is not one of TRAN_PRESETS, or the target has fewer than two distinct x values.
+    """
+    try:
+        settings = TRAN_PRESETS[preset.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown .TRAN preset '{preset}', expected one of {', '.join(TRAN_PRESETS)}")
+    rows = np.asarray(target_curve_rows, dtype=float)
+    x, first = np.unique(rows[:, 0], return_index=True)
+    if x.size < 2:
+        raise ValueError("The target curve needs at least two distinct x values to plan a transient")
+    y = rows[first, 1]
+    span = x[-1] - x[0]
+    spacing = float(np.median(np.diff(x)))
+
+    bandwidth = target_bandwidth(x, y, settings["energy"])
+    step_ceiling = span / settings["min_steps"]
+    if bandwidth > 0:
+        step_ceiling = min(step_ceiling, max(1.0 / (settings["steps_per_period"] * bandwidth), settings["min_step_factor"] * spacing))
+    step_ceiling = _round(step_ceiling)
+    print_interval = _round(min(settings["print_factor"] * spacing, span / settings["min_steps"]))
+    initial_step = min(step_ceiling, print_interval)
+    start_time = _round(max(0.0, x[0] - print_interval))
+    return TranPlan(initial_step, float(x[-1]), start_time, step_ceiling, print_interval, bandwidth, preset.lower())
@@ -0,0 +1,69 @@
+import os
+import shutil
+import atexit
+import tempfile
+
+"""
+Scratch workspaces for optimization runs.
+
+Every optimization run gets its own directory holding its writable netlist and the .prn files Xyce produces, and
+every worker process of that run gets its own subdirectory, so two optimizations of the same netlist (or two
+workers of one optimization) never overwrite each other's files. Workspaces are created on the RAM backed /dev/shm
+when it is available and writable, otherwise in the system temp directory. The XYCLOPS_SCRATCH environment
+variable overrides the location.
+"""
+
+SCRATCH_ENV_VAR = "XYCLOPS_SCRATCH"
+
+
+def default_scratch_root() -> str:
+    override = os.environ.get(SCRATCH_ENV_VAR)
+    if override and os.path.isdir(override) and os.access(override, os.W_OK):
+        return override
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class Workspace:
+    """Scratch directory for one optimization run."""
+
+    def __init__(self, source_netlist_path: str, root: str = None):
+        """
+        Args:
+            source_netlist_path: Netlist the run starts from. It is never modified, a copy is made in the workspace.
+            root: Directory to create the workspace in. Defaults to default_scratch_root().
+        """
+        self.source_netlist_path = source_netlist_path
+        self.root = root or default_scratch_root()
+        self.path = tempfile.mkdtemp(prefix="xyclops_run_", dir=self.root)
+        self.netlist_path = os.path.join(self.path, os.path.basename(source_netlist_path))
+        self.on_tmpfs = os.path.realpath(self.root).startswith("/dev/shm")
+        atexit.register(self.cleanup)
+
+    def io_report(self, backend) -> str:
+        """Human readable summary of where the run simulated and the file I/O backend did there.
+
+        Only the I/O of backend's own simulations is counted: the netlist writes and the reads of the output after a
+        run. Output streamed while the simulator runs overlaps with it and is left out.
+        """
+        location = "tmpfs" if self.on_tmpfs else "disk"
+        report = f"Scratch workspace on {location} ({self.root})"
+        if backend.netlist_writes:
+            report += (f", netlist writes and output reads took {backend.io_seconds:.3f}s over {backend.netlist_writes} simulations "
+                       f"({1000 * backend.io_seconds / backend.netlist_writes:.2f}ms each)")
+        return report
+
+    def export_netlist(self, destination_path: str) -> None:
+        """Copies the workspace netlist (e.g. the optimized result) to a permanent location."""
+        shutil.copyfile(self.netlist_path, destination_path)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+        atexit.unregister(self.cleanup)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
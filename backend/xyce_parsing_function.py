@@ -1,4 +1,7 @@
 import csv
+import io
+import numpy as np
+import re
 from typing import List, Tuple, Dict, Any, NamedTuple, Optional
 
 
@@ -20,6 +23,12 @@ class CurveFitError(Exception):
     pass
 
 
+class OptimizationStopped(CurveFitError):
+    """Raised inside an optimizer when it was asked to stop before finishing."""
+
+    pass
+
+
 def parse_xyce_prn_output(prn_filepath: str) -> Tuple[List[str], List[List[float]]]:
     """Parses a Xyce .prn output file.
 
@@ -66,3 +75,240 @@ def parse_xyce_prn_output(prn_filepath: str) -> Tuple[List[str], List[List[float
         raise
     except Exception as e:
         raise XyceError(f"An unexpected error occurred: {e}")
+
+
+def read_prn_columns(prn_filepath: str, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Reads selected columns of a (comma or space delimited) Xyce .prn file straight into NumPy arrays.
+
+    Unlike parse_xyce_prn_output this never converts cell by cell: the "End of Xyce" footer is cut off the text
+    once and the remaining rows are parsed by NumPy's C reader, loading only the requested columns.
+
+    Args:
+        prn_filepath: Path to the .prn file.
+        columns: Names of the columns to load (case-insensitive), e.g. ['TIME', 'V(2)']. All columns when None.
+
+    Returns:
+        A dict mapping each upper-case column name to a contiguous float64 array.
+
+    Raises:
+        XyceError: If the file cannot be opened or parsed, or a requested column is missing.
+    """
+    try:
+        with open(prn_filepath, "r") as prnfile:
+            header = prnfile.readline()
+            body = prnfile.read()
+    except FileNotFoundError:
+        raise XyceError(f".prn file not found: {prn_filepath}")
+    except OSError as e:
+        raise XyceError(f"Error opening .prn file: {e}")
+
+    # Space delimited files (e.g. Xyce's own .SENS.prn output) are read the same way
+    delimiter = "," if "," in header else None
+    variable_names = [name.strip().upper() for name in header.strip().split(delimiter)]
+    if columns is None:
+        wanted = variable_names
+    else:
+        wanted = list(dict.fromkeys(name.upper() for name in columns))
+        missing = [name for name in wanted if name not in variable_names]
+        if missing:
+            raise XyceError(f"Columns {', '.join(missing)} not found in {prn_filepath}")
+
+    footer = body.find("End of Xyce")
+    if footer != -1:
+        body = body[:footer]
+
+    try:
+        data = np.loadtxt(io.StringIO(body), delimiter=delimiter, usecols=[variable_names.index(name) for name in wanted],
+                          ndmin=2, dtype=np.float64)
+    except ValueError as e:
+        raise XyceError(f"Error parsing .prn file: Invalid data format, {e}")
+    if data.shape[0] == 0:
+        raise XyceError(f"No data rows found in the file {prn_filepath}")
+
+    # One contiguous row per column
+    data = np.ascontiguousarray(data.T)
+    return {name: data[i] for i, name in enumerate(wanted)}
+
+
+class PrnTail:
+    """Reads a comma delimited .prn file while the simulator is still writing it.
+
+    Every poll() reads whatever was appended since the last one and parses the complete rows in it. A row Xyce has
+    only written part of is kept back until the rest arrives, and the "End of Xyce" footer ends the data.
+    """
+
+    def __init__(self, prn_filepath: str):
+        self.prn_filepath = prn_filepath
+        self.file = None
+        self.variable_names = None
+        self.pending = ""
+        self.chunks = []
+        self.finished = False
+
+    def poll(self) -> Dict[str, np.ndarray]:
+        """Returns the rows completed since the last poll as upper-case column name -> array, {} when there are none.
+
+        Raises:
+            XyceError: If the new rows cannot be parsed.
+        """
+        if self.finished:
+            return {}
+        if self.file is None:
+            try:
+                self.file = open(self.prn_filepath, "r")
+            except FileNotFoundError:
+                # The simulator has not created it yet
+                return {}
+        text = self.pending + self.file.read()
+        last_newline = text.rfind("\n")
+        if last_newline == -1:
+            self.pending = text
+            return {}
+        self.pending = text[last_newline + 1:]
+        lines = text[:last_newline].split("\n")
+        if self.variable_names is None:
+            self.variable_names = [name.strip().upper() for name in lines.pop(0).split(",")]
+        for i, line in enumerate(lines):
+            if line.startswith("End of Xyce"):
+                lines = lines[:i]
+                self.finished = True
+                break
+        if not lines:
+            return {}
+        try:
+            data = np.loadtxt(io.StringIO("\n".join(lines)), delimiter=",", ndmin=2, dtype=np.float64)
+        except ValueError as e:
+            raise XyceError(f"Error parsing .prn file: Invalid data format, {e}")
+        self.chunks.append(data)
+        return {name: data[:, i] for i, name in enumerate(self.variable_names)}
+
+    def columns(self, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """Every row read so far, in the same form as read_prn_columns returns.
+
+        Raises:
+            XyceError: If no rows have been read yet or a requested column is missing.
+        """
+        if not self.chunks:
+            raise XyceError(f"No data rows read from {self.prn_filepath} yet")
+        wanted = self.variable_names if columns is None else list(dict.fromkeys(name.upper() for name in columns))
+        missing = [name for name in wanted if name not in self.variable_names]
+        if missing:
+            raise XyceError(f"Columns {', '.join(missing)} not found in {self.prn_filepath}")
+        data = np.concatenate(self.chunks)
+        return {name: np.ascontiguousarray(data[:, self.variable_names.index(name)]) for name in wanted}
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+_SENSITIVITY_COLUMN = re.compile(r"^D\{?.+?\}?/D\((\S+?)(?::\w+)?\)(_DIR)?$")
+
+
+def read_sensitivity_columns(sens_filepath: str) -> Dict[str, np.ndarray]:
+    """Reads the direct transient sensitivities Xyce writes for a .SENS command (the <netlist>.SENS.prn file).
+
+    Args:
+        sens_filepath: Path to the .SENS.prn file.
+
+    Returns:
+        A dict with the 'TIME' column and, for every parameter, the upper-case component name (e.g. 'R1') mapped
+        to d(objective)/d(parameter) at each time point. Scaled and adjoint columns are skipped.
+
+    Raises:
+        XyceError: If the file cannot be read or has no sensitivity columns.
+    """
+    columns = read_prn_columns(sens_filepath)
+    if "TIME" not in columns:
+        raise XyceError(f"No TIME column in {sens_filepath}")
+    sensitivities = {"TIME": columns["TIME"]}
+    for name, values in columns.items():
+        match = _SENSITIVITY_COLUMN.match(name)
+        if match:
+            sensitivities[match.group(1)] = values
+    if len(sensitivities) == 1:
+        raise XyceError(f"No sensitivity columns found in {sens_filepath}")
+    return sensitivities
+
+
+def _raw_column_name(name: str) -> str:
+    # Rawfiles may name node voltages by the bare node and branch currents as <device>#branch
+    name = name.upper()
+    if name.endswith("#BRANCH"):
+        return f"I({name[:-len('#BRANCH')]})"
+    if name != "TIME" and not re.match(r"^[VI]\(", name):
+        return f"V({name})"
+    return name
+
+
+def read_raw_columns(raw_filepath: str, columns: Optional[List[str]] = None, copy: bool = False) -> Dict[str, np.ndarray]:
+    """Reads a binary (SPICE3 format) Xyce rawfile through a memory map.
+
+    The returned arrays are views into the mapped file, so nothing is parsed or copied until the values are used.
+    The file must therefore not be truncated or rewritten in place while they are alive; delete it and let Xyce
+    create a new one instead (or pass copy=True).
+
+    Args:
+        raw_filepath: Path to the rawfile.
+        columns: Names of the columns to return (case-insensitive), e.g. ['TIME', 'V(2)']. All columns when None.
+        copy: Return independent in-memory copies instead of views into the mapped file.
+
+    Returns:
+        A dict mapping each upper-case column name to a float64 array.
+
+    Raises:
+        XyceError: If the file cannot be opened, is not a real-valued binary rawfile, or a requested column is missing.
+    """
+    try:
+        with open(raw_filepath, "rb") as rawfile:
+            header = {}
+            variable_names = []
+            while True:
+                line = rawfile.readline()
+                if not line:
+                    raise XyceError(f"No binary data section found in {raw_filepath}")
+                text = line.decode("ascii", errors="replace").strip()
+                if text.lower().startswith("binary:"):
+                    break
+                if text.lower().startswith("values:"):
+                    raise XyceError(f"{raw_filepath} is an ASCII rawfile, expected binary")
+                if ":" in text and not line.startswith((b"\t", b" ")):
+                    key, _, value = text.partition(":")
+                    header[key.strip().lower()] = value.strip()
+                elif text:
+                    fields = text.split()
+                    variable_names.append(_raw_column_name(fields[1]))
+            offset = rawfile.tell()
+    except FileNotFoundError:
+        raise XyceError(f"Rawfile not found: {raw_filepath}")
+    except OSError as e:
+        raise XyceError(f"Error opening rawfile: {e}")
+
+    if "complex" in header.get("flags", "real").lower():
+        raise XyceError(f"{raw_filepath} holds complex data, only real (transient) rawfiles are supported")
+    try:
+        variable_count = int(header["no. variables"])
+        point_count = int(header["no. points"])
+    except (KeyError, ValueError) as e:
+        raise XyceError(f"Invalid rawfile header in {raw_filepath}: {e}")
+    if point_count == 0:
+        raise XyceError(f"No data rows found in the file {raw_filepath}")
+
+    if columns is None:
+        wanted = variable_names
+    else:
+        wanted = list(dict.fromkeys(name.upper() for name in columns))
+        missing = [name for name in wanted if name not in variable_names]
+        if missing:
+            raise XyceError(f"Columns {', '.join(missing)} not found in {raw_filepath}")
+
+    try:
+        data = np.memmap(raw_filepath, dtype="<f8", mode="r", offset=offset, shape=(point_count, variable_count))
+    except ValueError as e:
+        raise XyceError(f"Rawfile {raw_filepath} is shorter than its header says: {e}")
+    result = {}
+    for name in wanted:
+        column = data[:, variable_names.index(name)]
+        result[name] = np.array(column) if copy else column
+    return result
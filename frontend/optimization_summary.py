@@ -1,8 +1,8 @@
 import tkinter as tk
 from tkinter import ttk
-import multiprocessing as mp
-import threading as th
-from backend.optimzation_process import optimizeProcess
+import numpy as np
+from backend.optimization_runner import OptimizationRunner
+from backend.progress_channel import ProgressChannel, decimate_minmax
 
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
@@ -56,13 +56,14 @@ class OptimizationSummary(tk.Frame):
         optimizationTolerances = self.controller.get_app_data("optimization_tolerances")
         RLCBounds = self.controller.get_app_data("RLC_bounds")
 
-        self.figure = Figure(figsize=(5, 2), dpi=100)
-        self.ax = self.figure.add_subplot(111)
+        self.figure = Figure(figsize=(5, 3.5), dpi=100)
+        self.ax, self.cost_ax = self.figure.subplots(2, 1, gridspec_kw={"height_ratios": [3, 2]})
         self.ax.set_title("Optimization Progress")
         self.ax.set_xlabel("Time")
         self.ax.set_ylabel(f"{curveData["y_parameter"]}")
-        self.figure.subplots_adjust(bottom=0.2)
-        self.line, = self.ax.plot([], [])  
+        self.figure.subplots_adjust(bottom=0.12, hspace=0.6)
+        # Animated lines are left out of full redraws and blitted over the saved background instead
+        self.line, = self.ax.plot([], [], animated=True)
         self.line2, = self.ax.plot([], [], color="red", linestyle="--", label="Second Line")
         xTargets=[]
         yTargets=[]
@@ -74,61 +75,181 @@ class OptimizationSummary(tk.Frame):
         self.minBound = (min(yTargets)- max(range*0.25,1))
         self.maxBound = (max(yTargets)+ max(range*0.25,1))
         self.ax.set_ylim(self.minBound,self.maxBound)
+        self.ax.set_xlim(min(xTargets),max(xTargets))
+
+        # Convergence: the cost of every evaluation and the best one so far
+        self.cost_ax.set_xlabel("Evaluation")
+        self.cost_ax.set_ylabel("Cost")
+        self.cost_ax.set_yscale("log", nonpositive="mask")
+        self.cost_line, = self.cost_ax.plot([], [], ".", color="gray", markersize=3, animated=True)
+        self.best_cost_line, = self.cost_ax.plot([], [], color="green", animated=True)
+        self.cost_ax.set_xlim(0, 10)
+        self.cost_ax.set_ylim(1e-3, 1)
+        self.costs = []
+        self.waveform = None
+        self.background = None
 
         self.canvas = FigureCanvasTkAgg(self.figure, master=main_frame)
+        # Every full redraw (including the ones Tk triggers on resize) saves a new background to blit onto
+        self.canvas.mpl_connect("draw_event", self.on_draw)
         self.canvas.draw()
         self.canvas.get_tk_widget().grid(row=2, column=0, pady=10, padx=20, sticky="nsew")
 
-        self.continue_button = ttk.Button(main_frame, text="Close", command=self.close_window)
-        self.continue_button.grid(row=3, column=0, pady=5, padx=20)
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=3, column=0, pady=5, padx=20)
+        self.pause_button = ttk.Button(button_frame, text="Pause", command=self.toggle_pause)
+        self.pause_button.grid(row=0, column=0, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_optimization)
+        self.cancel_button.grid(row=0, column=1, padx=5)
+        self.continue_button = ttk.Button(button_frame, text="Close", command=self.close_window)
+        self.continue_button.grid(row=0, column=2, padx=5)
 
         main_frame.grid_rowconfigure(1, weight=1)
         main_frame.grid_rowconfigure(2, weight=1)
         main_frame.grid_rowconfigure(3, weight=0)
         main_frame.grid_columnconfigure(0, weight=1)
 
-        self.queue = mp.Queue()
-        self.thread = th.Thread(
-            target=optimizeProcess,
-            args=(self.queue, curveData, testRows, netlistPath, netlistObject, selectedParameters, optimizationTolerances, RLCBounds)
+        # Keeps only the latest waveform and coalesces status messages, so the UI never falls behind the run
+        self.queue = ProgressChannel()
+        # The optimization runs in its own process so it can be paused and cancelled (with its Xyce runs) at any time
+        self.runner = OptimizationRunner(
+            self.queue,
+            (curveData, testRows, netlistPath, netlistObject, selectedParameters, optimizationTolerances, RLCBounds),
+            {"livePlot": True}
         )
-        self.thread.start()
+        self.runner.start()
+        if not self.runner.supports_pause:
+            self.pause_button.state(["disabled"])
+        self.result_received = False
 
         self.update_ui()
 
     def update_ui(self):
+        if self.runner.state == "cancelled":
+            return
+        done = False
+        # Checked before polling: once the process has ended everything it sent can be read
+        ended = self.runner.finished()
         try:
-            while not self.queue.empty():
-                msg_type, msg_value = self.queue.get_nowait()
+            # Only the latest waveform of a tick is drawn, and the plots are redrawn at most once per tick
+            waveform = None
+            new_costs = []
+            for msg_type, msg_value in self.queue.poll():
                 if msg_type == "Update":
                     self.tree.insert("", 0, values=("Update:", msg_value))
                 elif msg_type == "Done":
                     self.tree.insert("", 0, values=("", msg_value))
                     self.complete_label.config(text="Optimization Complete")
-                    return
+                    self.result_received = True
+                    done = True
                 elif msg_type == "Failed":
                     self.tree.insert("", 0, values=("Optimization Failed", msg_value))
+                    self.result_received = True
                 elif msg_type == "UpdateNetlist":
                     self.controller.update_app_data("netlist_object", msg_value)
                 elif msg_type == "UpdateOptimizationResults":
                     self.controller.update_app_data("optimization_results", msg_value)
                 elif msg_type == "UpdateYData":
-                    self.update_graph(msg_value)  
+                    waveform = msg_value
+                elif msg_type == "UpdateCost":
+                    new_costs.extend(msg_value)
+            if waveform is not None or new_costs:
+                self.update_graph(waveform, new_costs)
         except Exception as e:
             print("UI Update Error:", e)
 
+        if done:
+            self.pause_button.state(["disabled"])
+            self.cancel_button.state(["disabled"])
+        if ended:
+            if not self.result_received:
+                self.tree.insert("", 0, values=("Optimization Failed", f"The optimization process exited unexpectedly (exit code {self.runner.exitcode})"))
+            self.queue.close()
+            self.pause_button.state(["disabled"])
+            self.cancel_button.state(["disabled"])
+            return
         self.parent.after(100, self.update_ui)
 
-    def update_graph(self, xy_data):
-        data = tuple(xy_data)
-        y_data = list(data[1])
-        x_data = list(data[0])
-        if isinstance(y_data, list):
-            self.line.set_data(x_data, y_data)
-            self.ax.relim()
-            self.ax.autoscale_view()
-            self.ax.set_ylim(min(self.minBound,min(y_data) - 1),max(self.maxBound,max(y_data) + 1))
+    def update_graph(self, xy_data, new_costs):
+        limits_changed = False
+        if xy_data is not None:
+            x_data, y_data = (np.asarray(values, dtype=float) for values in xy_data)
+            if x_data.size:
+                # Two points (minimum and maximum) per pixel column are all the axes can show
+                x_data, y_data = decimate_minmax(x_data, y_data, 2 * max(int(self.ax.get_window_extent().width), 1))
+                self.line.set_data(x_data, y_data)
+                limits_changed |= self.include_in_limits(self.ax, x_data, y_data, 1)
+        if new_costs:
+            self.costs.extend(new_costs)
+            costs = np.asarray(self.costs, dtype=float)
+            evaluations = np.arange(1, costs.size + 1)
+            self.cost_line.set_data(evaluations, costs)
+            self.best_cost_line.set_data(evaluations, np.minimum.accumulate(costs))
+            positive = costs[costs > 0]
+            if positive.size:
+                limits_changed |= self.include_in_limits(self.cost_ax, evaluations, positive, 0)
+        if limits_changed or self.background is None:
+            # on_draw blits the lines once the rest is drawn
             self.canvas.draw()
+        else:
+            self.blit_lines()
+
+    def include_in_limits(self, ax, x_data, y_data, margin):
+        # Widens the axes (with room to spare) when the data leaves them, so a full redraw stays rare
+        xmin, xmax = ax.get_xlim()
+        ymin, ymax = ax.get_ylim()
+        changed = False
+        if x_data.min() < xmin or x_data.max() > xmax:
+            if ax is self.cost_ax:
+                xmax = max(xmax, 2 * x_data.max())
+            else:
+                xmin, xmax = min(xmin, x_data.min()), max(xmax, x_data.max())
+            ax.set_xlim(xmin, xmax)
+            changed = True
+        if y_data.min() < ymin or y_data.max() > ymax:
+            if ax.get_yscale() == "log":
+                ax.set_ylim(min(ymin, y_data.min() / 10), max(ymax, y_data.max() * 10))
+            else:
+                span = max(ymax - ymin, margin)
+                ax.set_ylim(min(ymin, y_data.min() - 0.25 * span), max(ymax, y_data.max() + 0.25 * span))
+            changed = True
+        return changed
+
+    def on_draw(self, event):
+        # The canvas shows the whole image right after this, lines included
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in (self.line, self.cost_line, self.best_cost_line):
+            line.axes.draw_artist(line)
+
+    def blit_lines(self):
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.figure.bbox)
+
+    def toggle_pause(self):
+        if self.runner.state == "running":
+            self.runner.pause()
+            self.pause_button.config(text="Resume")
+            self.complete_label.config(text="Optimization Paused")
+        elif self.runner.state == "paused":
+            self.runner.resume()
+            self.pause_button.config(text="Pause")
+            self.complete_label.config(text="Optimization In Progress")
+
+    def cancel_optimization(self):
+        if self.runner.state not in ("running", "paused"):
+            return
+        self.runner.cancel()
+        self.queue.close()
+        self.tree.insert("", 0, values=("Optimization Cancelled", "The optimization and its simulations were stopped"))
+        self.complete_label.config(text="Optimization Cancelled")
+        self.pause_button.state(["disabled"])
+        self.cancel_button.state(["disabled"])
 
     def close_window(self):
+        self.runner.cancel()
+        self.queue.close()
         self.parent.quit()
@@ -0,0 +1,56 @@
+import json
+import numpy as np
+import pytest
+from backend.standin_simulator import StandInCircuit
+from backend.batch_job import load_job, run_job
+
+"""
+Jacobian modes compared against plain finite differences on a stand-in RC fit.
+"""
+
+RC = """* RC
+.TRAN 10us 5ms 0 10us
+.PRINT TRAN V(OUT)
+VIN IN 0 PULSE(0 10 0 1us 1us 2ms 4ms)
+R1 IN OUT {r1}
+R2 OUT 0 {r2}
+C1 OUT 0 {c1}
+.END
+"""
+
+
+@pytest.fixture
+def rc_job(tmp_path):
+    (tmp_path / "true.cir").write_text(RC.format(r1=2200, r2=1500, c1=2.7e-7))
+    times, columns = StandInCircuit(str(tmp_path / "true.cir")).simulate()
+    # A target no component values reach exactly, so the fit ends at a non-zero cost
+    target = columns["V(OUT)"] + np.sin(3000 * times)
+    (tmp_path / "target.csv").write_text("".join(f"{t},{y}\n" for t, y in zip(times[::5], target[::5])))
+    (tmp_path / "rc.cir").write_text(RC.format(r1=1000, r2=3000, c1=1e-6))
+
+    def run(mode):
+        job = {
+            "netlist": "rc.cir",
+            "selected_parameters": ["R1", "R2", "C1"],
+            "target_value": "V(OUT)",
+            "target_csv": "target.csv",
+            "simulator": "standin",
+            "parameter_transform": "log",
+            "tolerances": [1e-10, 1e-10, 1e-10],
+            "jacobian_mode": mode,
+            "output_netlist": f"fitted_{mode}.txt",
+        }
+        (tmp_path / "job.json").write_text(json.dumps(job))
+        result = run_job(load_job(str(tmp_path / "job.json")))
+        assert result["status"] == "done", result["error"]
+        return result["results"]
+
+    return run
+
+
+@pytest.mark.parametrize("mode", ["broyden", "sensitivity"])
+def test_mode_matches_finite_differences_with_fewer_runs(rc_job, mode):
+    finite_difference = rc_job("finite-difference")
+    other = rc_job(mode)
+    assert other["final_cost"] == pytest.approx(finite_difference["final_cost"], rel=1e-3)
+    assert other["xyce_runs"] < finite_difference["xyce_runs"]
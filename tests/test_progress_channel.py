@@ -0,0 +1,44 @@
+import re
+import time
+import threading
+from backend.progress_channel import ProgressChannel
+
+"""
+The progress channel keeps a bounded number of messages waiting when the GUI stops polling.
+"""
+
+
+def _drain(channel):
+    # Results wait for room in the queue, so Done is sent from a thread while this one polls
+    done = threading.Thread(target=channel.put, args=(("Done", "finished"),))
+    done.start()
+    messages = []
+    for _ in range(100):
+        time.sleep(0.02)
+        messages += channel.poll()
+        if messages and messages[-1] == ("Done", "finished"):
+            done.join()
+            return messages
+    raise AssertionError("the channel never delivered Done")
+
+
+def test_stalled_gui_keeps_backlog_bounded():
+    channel = ProgressChannel(waveform_points=16, backlog=4, status_interval=0)
+    try:
+        for i in range(100):
+            channel.put(("Update", f"step {i} done"))
+            # The backlog plus the skipped note
+            assert len(channel.pending) <= channel.backlog + 1
+        # A counter is the newest message, so its value gets through
+        channel.put(("Update", "total runs completed: 100"))
+
+        updates = [value for kind, value in _drain(channel) if kind == "Update"]
+        steps = [value for value in updates if value.startswith("step")]
+        counters = [value for value in updates if value.startswith("total runs")]
+        skipped = sum(int(re.match(r"(\d+) progress", value).group(1)) for value in updates if "skipped" in value)
+        # Every status message was either delivered or counted as skipped, and the newest ones were kept
+        assert len(steps) + len(counters) + skipped == 101
+        assert steps[-1] == "step 99 done"
+        assert counters == ["total runs completed: 100"]
+    finally:
+        channel.close()
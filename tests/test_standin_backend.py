@@ -0,0 +1,87 @@
+import json
+import numpy as np
+import pytest
+from backend.netlist_parse import Netlist
+from backend.simulator_backend import SimulatorBackend, StandInBackend, make_backend
+from backend.standin_simulator import StandInCircuit
+from backend.xyce_parsing_function import parse_xyce_prn_output
+from backend.batch_job import load_job, run_job
+
+"""
+Smoke tests on the stand-in simulator, so the parse -> simulate -> fit pipeline runs on machines without Xyce.
+"""
+
+DIVIDER = """* Voltage Divider
+.TRAN 1ms 20ms 0ms 1ms
+.PRINT TRAN V(2)
+VIN 1 0 5
+R1 1 2 2000
+R2 2 0 2000
+.END
+"""
+
+RC = """* RC low pass
+.TRAN 10us 2ms 0 10us
+.PRINT TRAN V(2)
+VIN 1 0 PULSE(0 5 0 1us 1us 1 2)
+R1 1 2 1000
+C1 2 0 1e-7
+.END
+"""
+
+
+def _write(directory, name, text):
+    path = directory / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        SimulatorBackend("unused.txt")
+
+
+def test_prn_round_trip(tmp_path):
+    netlist_path = _write(tmp_path, "rc.cir", RC)
+    times, expected = StandInCircuit(netlist_path).simulate()
+
+    backend = make_backend("standin", netlist_path)
+    assert isinstance(backend, StandInBackend)
+    backend.output_columns = ["TIME", "V(2)"]
+    columns = backend.simulate(Netlist(netlist_path), {})
+
+    # The .prn keeps 9 significant digits
+    np.testing.assert_allclose(columns["TIME"], times, rtol=1e-8, atol=1e-15)
+    np.testing.assert_allclose(columns["V(2)"], expected["V(2)"], rtol=1e-8, atol=1e-12)
+    # The slower cell-by-cell parser reads the same file the same way
+    header, rows = parse_xyce_prn_output(netlist_path + ".prn")
+    assert [name.upper() for name in header[1:]] == ["TIME", "V(2)"]
+    np.testing.assert_allclose(np.array(rows)[:, 2], columns["V(2)"])
+
+
+def test_parameters_reach_the_simulation(tmp_path):
+    netlist_path = _write(tmp_path, "divider.txt", DIVIDER)
+    backend = make_backend("standin", netlist_path)
+    columns = backend.simulate(Netlist(netlist_path), {"R2": 8000.0})
+    np.testing.assert_allclose(columns["V(2)"], 4.0, rtol=1e-6)
+
+
+def test_fit_voltage_divider(tmp_path):
+    _write(tmp_path, "divider.txt", DIVIDER)
+    (tmp_path / "target.csv").write_text("".join(f"{t / 1000},4.0\n" for t in range(21)))
+    job = {
+        "netlist": "divider.txt",
+        "selected_parameters": ["R2"],
+        "target_value": "V(2)",
+        "target_csv": "target.csv",
+        "simulator": "standin",
+        "output_netlist": "fitted.txt",
+    }
+    (tmp_path / "job.json").write_text(json.dumps(job))
+
+    result = run_job(load_job(str(tmp_path / "job.json")))
+
+    assert result["status"] == "done", result["error"]
+    assert result["results"]["final_cost"] < 1e-6
+    assert result["component_values"]["R2"] == pytest.approx(8000.0, rel=1e-3)
+    assert Netlist(result["output_netlist"]).components.get("R2").value == pytest.approx(8000.0, rel=1e-3)